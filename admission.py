@@ -0,0 +1,144 @@
+"""
+Priority-aware admission control for API traffic.
+
+Requests are admitted per traffic class into a shared pool of execution slots:
+
+- interactive: patient-facing /chat/ requests; may use the whole pool
+- evaluation: evaluation replays (/chat/ with `X-Traffic-Class: evaluation`)
+- bulk: document uploads
+
+Each class has its own concurrency budget and a bounded FIFO wait queue. When a
+slot frees up it goes to the highest-priority class that is waiting and still
+under its budget, so bulk and evaluation work can never take more than their
+share. A request arriving at a full queue is shed with `Overloaded`, which the
+API turns into 429 with a Retry-After estimated from recent service times.
+
+Background ingestion runs outside the request path; its workers call
+`wait_for_idle("interactive")` before each embedding batch to step aside while
+chat is busy.
+"""
+
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+from tracing import increment, observe, set_gauge
+
+
+INTERACTIVE = "interactive"
+EVALUATION = "evaluation"
+BULK = "bulk"
+
+# Slots shared by all classes; each class's own budget and queue depth are below
+ADMISSION_TOTAL_CONCURRENCY = int(os.getenv("ADMISSION_TOTAL_CONCURRENCY", "8"))
+ADMISSION_LIMITS = {
+    INTERACTIVE: {"priority": 0, "concurrency": ADMISSION_TOTAL_CONCURRENCY,
+                  "max_queue": int(os.getenv("ADMISSION_INTERACTIVE_QUEUE", "64"))},
+    EVALUATION: {"priority": 1, "concurrency": int(os.getenv("ADMISSION_EVALUATION_CONCURRENCY", "2")),
+                 "max_queue": int(os.getenv("ADMISSION_EVALUATION_QUEUE", "32"))},
+    BULK: {"priority": 2, "concurrency": int(os.getenv("ADMISSION_BULK_CONCURRENCY", "2")),
+           "max_queue": int(os.getenv("ADMISSION_BULK_QUEUE", "16"))},
+}
+
+# Longest a background ingestion batch is held back for interactive traffic
+BULK_YIELD_MAX_SECONDS = 2.0
+BULK_YIELD_POLL_SECONDS = 0.05
+
+# Smoothing factor for the per-class service time used in Retry-After
+SERVICE_TIME_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """Raised when a traffic class's wait queue is full; carries a Retry-After hint in seconds."""
+
+    def __init__(self, traffic_class: str, retry_after: int):
+        super().__init__(f"Too many queued {traffic_class} requests; retry in {retry_after}s")
+        self.traffic_class = traffic_class
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Per-class concurrency budgets and bounded priority queues over a shared slot pool."""
+
+    def __init__(self, limits: Dict[str, Dict] = None, total_concurrency: int = ADMISSION_TOTAL_CONCURRENCY):
+        self.limits = limits or ADMISSION_LIMITS
+        self.total_concurrency = total_concurrency
+        self._by_priority = sorted(self.limits, key=lambda name: self.limits[name]["priority"])
+        self._inflight = {name: 0 for name in self.limits}
+        self._waiting: Dict[str, Deque[asyncio.Future]] = {name: deque() for name in self.limits}
+        self._service_time = {name: 1.0 for name in self.limits}
+
+    def _has_slot(self, name: str) -> bool:
+        return (sum(self._inflight.values()) < self.total_concurrency
+                and self._inflight[name] < self.limits[name]["concurrency"])
+
+    def retry_after(self, name: str) -> int:
+        """Seconds until a newly queued request of this class would likely be served."""
+        backlog = len(self._waiting[name]) + 1
+        return max(1, math.ceil(self._service_time[name] * backlog / self.limits[name]["concurrency"]))
+
+    def _record_depth(self, name: str):
+        set_gauge(f"admission_queue_depth_{name}", len(self._waiting[name]))
+        set_gauge(f"admission_inflight_{name}", self._inflight[name])
+
+    async def _acquire(self, name: str):
+        if not self._waiting[name] and self._has_slot(name):
+            self._inflight[name] += 1
+            self._record_depth(name)
+            observe(f"admission_wait_{name}", 0.0)
+            return
+        if len(self._waiting[name]) >= self.limits[name]["max_queue"]:
+            increment(f"admission_shed_{name}")
+            raise Overloaded(name, self.retry_after(name))
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[name].append(future)
+        self._record_depth(name)
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted a slot just as the caller went away; hand it on
+                self._release(name)
+            elif future in self._waiting[name]:
+                self._waiting[name].remove(future)
+                self._record_depth(name)
+            raise
+        observe(f"admission_wait_{name}", time.perf_counter() - start)
+
+    def _release(self, name: str):
+        self._inflight[name] -= 1
+        for candidate in self._by_priority:
+            waiting = self._waiting[candidate]
+            while waiting and self._has_slot(candidate):
+                future = waiting.popleft()
+                if not future.done():
+                    self._inflight[candidate] += 1
+                    future.set_result(None)
+            self._record_depth(candidate)
+
+    @asynccontextmanager
+    async def admit(self, name: str):
+        """Hold one slot of `name`'s budget for the enclosed block, waiting or shedding as needed."""
+        await self._acquire(name)
+        increment(f"admission_admitted_{name}")
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._service_time[name] += SERVICE_TIME_ALPHA * (elapsed - self._service_time[name])
+            self._release(name)
+
+    def wait_for_idle(self, name: str, max_seconds: float = BULK_YIELD_MAX_SECONDS):
+        """Block the calling (non-event-loop) thread while `name` has requests running or queued."""
+        start = time.perf_counter()
+        while (self._inflight[name] or self._waiting[name]) and time.perf_counter() - start < max_seconds:
+            time.sleep(BULK_YIELD_POLL_SECONDS)
+        waited = time.perf_counter() - start
+        if waited >= BULK_YIELD_POLL_SECONDS:
+            observe(f"admission_yield_{name}", waited)
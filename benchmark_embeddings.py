@@ -0,0 +1,73 @@
+"""
+Embedding backend benchmark.
+
+Encodes the same texts with the reference SentenceTransformer and each selected
+backend, called the way the app calls it (no normalization flags), and reports
+throughput, cosine agreement with the reference and the largest deviation of an
+embedding's norm from the reference's unit length.
+Texts are chunks of the documents folder, repeated up to --texts.
+
+Example:
+    python benchmark_embeddings.py --backends torch onnx onnx-int8 --threads 4
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+
+from embeddings import BACKENDS, load_embedding_model
+
+
+def load_texts(folder: str, count: int):
+    """Chunk the markdown reports in `folder` and repeat the chunks up to `count` texts."""
+    # Same splitter settings as database.chunk_text, without opening the vector store
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=50)
+    chunks = []
+    for file_name in sorted(os.listdir(folder)):
+        if file_name.endswith(".md"):
+            with open(os.path.join(folder, file_name), "r", encoding="utf-8") as f:
+                chunks.extend(splitter.split_text(f.read()))
+    if not chunks:
+        raise SystemExit(f"No markdown documents found in {folder}")
+    return [chunks[i % len(chunks)] for i in range(count)]
+
+
+def time_encode(model, texts, batch_size: int):
+    model.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+    start = time.perf_counter()
+    # Same call as database.py makes, so a backend that skips normalization shows up below
+    embeddings = model.encode(texts, batch_size=batch_size)
+    return np.asarray(embeddings, dtype=np.float32), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends against the reference model.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (0 = library default)")
+    parser.add_argument("--texts", type=int, default=2000, help="Number of texts to encode")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--documents", default="documents", help="Folder of markdown reports to sample")
+    args = parser.parse_args()
+
+    texts = load_texts(args.documents, args.texts)
+    reference, reference_seconds = time_encode(
+        load_embedding_model("torch", args.threads), texts, args.batch_size
+    )
+
+    print(f"{'backend':<12}{'texts/s':>10}{'speedup':>10}{'mean cos':>10}{'min cos':>10}{'norm err':>10}")
+    for backend in args.backends:
+        if backend == "torch":
+            embeddings, seconds = reference, reference_seconds
+        else:
+            embeddings, seconds = time_encode(load_embedding_model(backend, args.threads), texts, args.batch_size)
+        norms = np.linalg.norm(embeddings, axis=1)
+        agreement = np.einsum("ij,ij->i", embeddings, reference) / (norms * np.linalg.norm(reference, axis=1))
+        print(f"{backend:<12}{len(texts) / seconds:>10.1f}{reference_seconds / seconds:>9.2f}x"
+              f"{agreement.mean():>10.4f}{agreement.min():>10.4f}{np.abs(norms - 1).max():>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Retrieval-augmented answering path shared by the API and the offline evaluation runner.
+
+Queries are routed through tiers, cheapest first:
+1. fact: plain lookups answered from the structured fact index
+2. extractive: short factual questions answered with a BioBERT span over the top chunks
+3. generative: full RAG prompt answered by LLaMA
+
+Retrieval, fact lookup, compression and extractive QA go through the retrieval
+backend, which is either in-process or a shared retrieval service.
+"""
+
+import re
+import time
+import logging
+from typing import Dict, List, Optional
+from retrieval_backend import get_retrieval_backend
+from fact_index import NEEDS_REASONING
+from ollama_chat import generate_response
+from model_instructions import get_system_prompt, get_chat_template
+from tracing import span, increment, observe
+
+
+logger = logging.getLogger(__name__)
+
+NO_CONTEXT_MESSAGE = "No relevant medical information found in the database."
+
+# Extractive tier: minimum span confidence to answer without the LLM, how many
+# top chunks the QA model reads, and which questions are short and factual enough to try.
+EXTRACTIVE_CONFIDENCE_THRESHOLD = 0.5
+EXTRACTIVE_TOP_CHUNKS = 3
+EXTRACTIVE_MAX_QUESTION_WORDS = 15
+_SIMPLE_FACTUAL_QUESTION = re.compile(
+    r"^\s*(what|which|when|who|where|how (much|many|often|long))\b", re.IGNORECASE
+)
+
+TIER_FACT = "fact"
+TIER_EXTRACTIVE = "extractive"
+TIER_GENERATIVE = "generative"
+
+def is_simple_factual(query: str) -> bool:
+    """Whether a question is short and factual enough to try the extractive tier.
+
+    Questions asking for advice or interpretation ("what should I do about...")
+    need the LLM's reasoning and disclaimers, as in the fact tier.
+    """
+    return (len(query.split()) <= EXTRACTIVE_MAX_QUESTION_WORDS
+            and bool(_SIMPLE_FACTUAL_QUESTION.search(query))
+            and not NEEDS_REASONING.search(query))
+
+
+def try_extractive_answer(query: str, relevant_docs: List[str]) -> Optional[str]:
+    """Answer with an extracted span from the top chunks if the QA model is confident enough."""
+    if not relevant_docs or not is_simple_factual(query):
+        return None
+    increment("tier_extractive_attempted")
+    with span("tier_extractive"):
+        try:
+            best = get_retrieval_backend().extract_answer(query, relevant_docs[:EXTRACTIVE_TOP_CHUNKS])
+        except Exception as e:
+            logger.error(f"Extractive QA failed: {str(e)}")
+            return None
+    if best is None or best['score'] < EXTRACTIVE_CONFIDENCE_THRESHOLD:
+        return None
+    increment("tier_extractive_hit")
+    return best['answer']
+
+
+def build_prompt(query: str, context: str) -> str:
+    """Format the detailed-answer RAG prompt for a query and its retrieved context."""
+    system_prompt = get_system_prompt()
+    chat_template = get_chat_template()
+
+    return chat_template.format(
+        system_prompt=system_prompt,
+        user_message=f"""Based on the following medical information:
+
+CONTEXT:
+{context}
+
+Please provide a detailed medical response to: {query}
+
+Guidelines for your response:
+1. If the context contains relevant medical information, use it to provide a comprehensive answer
+2. Explain medical terms in simple language
+3. Include relevant medical details from the context
+4. If the context doesn't contain relevant information, acknowledge this and provide general medical guidance
+5. Always maintain a professional medical tone
+6. Include appropriate medical disclaimers
+7. Suggest consulting healthcare providers when appropriate"""
+    )
+
+
+def record_answer(tier: str, start_time: float, response: str, relevant_docs: List[str]) -> Dict:
+    """Record per-tier latency and hit counts, and build the result dict."""
+    observe(f"answered_{tier}", time.perf_counter() - start_time)
+    increment(f"answered_{tier}")
+    return {
+        "response": response,
+        "context_used": tier == TIER_FACT or bool(relevant_docs),
+        "relevant_docs_count": len(relevant_docs),
+        "answered_by": tier
+    }
+
+
+def route_query(query: str, sources: Optional[List[str]] = None) -> Dict:
+    """Run the fact and extractive tiers, retrieving and compressing context on the way.
+
+    Returns a dict with `tier`, `response`, `relevant_docs` and `context`. `response`
+    is set when a cheap tier answered; otherwise `tier` is generative and `context`
+    holds the compressed context for the caller's LLM prompt.
+    """
+    backend = get_retrieval_backend()
+
+    # Plain factual questions are answered straight from the structured fact index
+    with span("fact_lookup"):
+        fact_answer = backend.answer_fact(query, sources=sources)
+    if fact_answer:
+        return {"tier": TIER_FACT, "response": fact_answer, "relevant_docs": [], "context": ""}
+
+    with span("retrieve"):
+        relevant_docs = backend.retrieve(query, sources=sources)
+
+    extractive_answer = try_extractive_answer(query, relevant_docs)
+    if extractive_answer:
+        return {"tier": TIER_EXTRACTIVE, "response": extractive_answer,
+                "relevant_docs": relevant_docs, "context": ""}
+
+    context = backend.compress(query, relevant_docs) if relevant_docs else ""
+    return {"tier": TIER_GENERATIVE, "response": None, "relevant_docs": relevant_docs, "context": context}
+
+
+def answer_query(query: str, sources: Optional[List[str]] = None) -> Dict:
+    """Answer a query through the fact, extractive and generative tiers in turn.
+
+    Returns a dict with `response`, `context_used`, `relevant_docs_count` and `answered_by`.
+    """
+    start_time = time.perf_counter()
+    routed = route_query(query, sources)
+    if routed["response"] is not None:
+        return record_answer(routed["tier"], start_time, routed["response"], routed["relevant_docs"])
+
+    context = routed["context"] or NO_CONTEXT_MESSAGE
+
+    with span("prompt_build"):
+        prompt = build_prompt(query, context)
+
+    with span("generate"):
+        response = generate_response(prompt, context)
+
+    return record_answer(TIER_GENERATIVE, start_time, response, routed["relevant_docs"])
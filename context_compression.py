@@ -0,0 +1,71 @@
+"""
+Query-aware extractive compression of retrieved context.
+
+Retrieved chunks are split into sentences, every sentence is scored against the
+query in one batched embedding pass, and only the best sentences that fit the
+token budget are kept, in their original order.
+"""
+
+import re
+from typing import List
+import numpy as np
+from database import embedding_model
+from tracing import span
+
+
+# Approximate prompt tokens allowed for the retrieved context
+CONTEXT_TOKEN_BUDGET = 256
+
+# Rough characters-per-token ratio for LLaMA-style tokenizers on English text
+CHARS_PER_TOKEN = 4
+
+# Sentence ends, line breaks, and " - " list bullets (PDF text loses its line breaks)
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+|\s+(?=- )")
+# A line break followed by a lowercase letter is a soft wrap inside a sentence
+_SOFT_WRAP = re.compile(r"\s*\n(?=\s*[a-z])")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for budgeting."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences, also breaking on line ends and bullets so list items stay separate."""
+    text = _SOFT_WRAP.sub(" ", text)
+    return [sentence.strip() for sentence in _SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def compress_context(query: str, documents: List[str],
+                     token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Keep the sentences of `documents` most relevant to `query` within `token_budget`."""
+    sentences = []
+    seen = set()
+    for document in documents:
+        for sentence in split_sentences(document):
+            # Overlapping chunks repeat sentences; keep the first occurrence only
+            key = " ".join(sentence.lower().split())
+            if key not in seen:
+                seen.add(key)
+                sentences.append(sentence)
+    if not sentences:
+        return ""
+    if sum(estimate_tokens(sentence) for sentence in sentences) <= token_budget:
+        return "\n".join(sentences)
+
+    with span("compress_context"):
+        embeddings = embedding_model.encode([query] + sentences, normalize_embeddings=True)
+        scores = embeddings[1:] @ embeddings[0]
+
+        kept = []
+        used = 0
+        for index in np.argsort(-scores):
+            cost = estimate_tokens(sentences[index])
+            if used + cost > token_budget:
+                continue
+            kept.append(index)
+            used += cost
+        if not kept:
+            # Even the best sentence exceeds the budget; keep a truncated copy of it
+            return sentences[int(np.argmax(scores))][:token_budget * CHARS_PER_TOKEN]
+        return "\n".join(sentences[index] for index in sorted(kept))
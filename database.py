@@ -2,11 +2,15 @@ import chromadb
 from chromadb.config import Settings
 import os
 import logging
-from typing import List
+import threading
+from typing import Callable, Dict, List, Optional
 import PyPDF2
 import io
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
+from embeddings import get_embedding_model
+from tracing import span
+from fact_index import FactIndex
 
 
 logging.basicConfig(level=logging.INFO)
@@ -28,25 +32,138 @@ except:
     collection = client.create_collection(COLLECTION_NAME)
     logger.info(f"Created new collection: {COLLECTION_NAME}")
 
+# Identifies the index contents across compactions; changes only when the index is cleared
+index_id = str(collection.id)
+
 DOCUMENTS_FOLDER = "documents"
 os.makedirs(DOCUMENTS_FOLDER, exist_ok=True)
 
 
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+# Backend (torch / onnx / onnx-int8) and thread count come from the environment, see embeddings.py
+embedding_model = get_embedding_model()
+
+# Structured facts (medications, lab values, ...) extracted at ingest for direct lookups;
+# in-memory like the collection, so both are cleared, snapshotted and discarded together
+fact_index = FactIndex()
+
+INGEST_BATCH_SIZE = 64
+
+# Retrieval diversification: candidates fetched per query, MMR relevance/diversity
+# trade-off, similarity above which a candidate counts as a near-duplicate, and the
+# fraction of the best candidate's relevance a further result must keep.
+MMR_FETCH_K = 20
+MMR_LAMBDA = 0.7
+DUPLICATE_SIMILARITY = 0.95
+MIN_RELEVANCE_RATIO = 0.8
+
+# Compaction: rebuild the collection once deleted chunks exceed this fraction of
+# live plus deleted ones (HNSW only marks deletions, so search degrades with churn)
+COMPACTION_THRESHOLD = float(os.getenv("COMPACTION_THRESHOLD", "0.2"))
+COMPACTION_PAGE_SIZE = 1000
+
+# Serializes collection writes with compaction, which copies and swaps the collection
+write_lock = threading.RLock()
+deleted_since_compaction = 0
+collection_generation = 0
+
+def _create_next_collection():
+    """Create the next generation's collection, so a swap never has to rename or reuse a live name."""
+    global collection_generation
+    collection_generation += 1
+    name = f"{COLLECTION_NAME}_{collection_generation}"
+    try:
+        client.delete_collection(name)
+    except ValueError:
+        pass
+    return client.create_collection(name)
 
 def clear_database():
     """Clear all data from the database."""
+    global collection, deleted_since_compaction, index_id
     try:
-        client.delete_collection(COLLECTION_NAME)
-        global collection
-        collection = client.create_collection(COLLECTION_NAME)
+        with write_lock:
+            old = collection
+            collection = _create_next_collection()
+            index_id = str(collection.id)
+            deleted_since_compaction = 0
+            client.delete_collection(old.name)
+        fact_index.clear()
         logger.info("Database cleared successfully")
     except Exception as e:
         logger.error(f"Error clearing database: {str(e)}")
         raise
 
-def extract_text_from_pdf(pdf_content: bytes) -> str:
-    """Extract text content from a PDF file."""
+def delete_sources(sources: List[str]) -> Dict[str, int]:
+    """Delete all chunks and facts stored under the given source names.
+
+    Returns the number of chunks and facts removed.
+    """
+    global deleted_since_compaction
+    if not sources:
+        return {"chunks": 0, "facts": 0}
+    try:
+        with write_lock:
+            where = {"source": {"$in": list(sources)}}
+            chunk_ids = collection.get(where=where, include=[])["ids"]
+            if chunk_ids:
+                collection.delete(ids=chunk_ids)
+            deleted_since_compaction += len(chunk_ids)
+        facts = fact_index.delete_sources(sources)
+        logger.info(f"Deleted {len(chunk_ids)} chunks and {facts} facts for sources: {', '.join(sources)}")
+        return {"chunks": len(chunk_ids), "facts": facts}
+    except Exception as e:
+        logger.error(f"Error deleting sources: {str(e)}")
+        raise
+
+def list_sources() -> Dict[str, int]:
+    """Chunk counts per stored source."""
+    counts = {}
+    for offset in range(0, collection.count(), COMPACTION_PAGE_SIZE):
+        page = collection.get(limit=COMPACTION_PAGE_SIZE, offset=offset, include=["metadatas"])
+        for metadata in page["metadatas"]:
+            source = (metadata or {}).get("source")
+            counts[source] = counts.get(source, 0) + 1
+    return counts
+
+def deleted_ratio() -> float:
+    """Fraction of the collection's entries (live plus deleted since last compaction) that are deleted."""
+    total = collection.count() + deleted_since_compaction
+    return deleted_since_compaction / total if total else 0.0
+
+def compact_index(force: bool = False) -> bool:
+    """Rebuild the collection from its live chunks if enough of it has been deleted.
+
+    Chunks are copied page by page, with their stored embeddings, into a fresh
+    collection. Readers are pointed at the copy before the old collection is
+    deleted, since they do not take `write_lock`. The fact store is vacuumed.
+    Returns whether a compaction ran.
+    """
+    global collection, deleted_since_compaction
+    with write_lock:
+        if not force and deleted_ratio() < COMPACTION_THRESHOLD:
+            return False
+        with span("compact_index"):
+            old = collection
+            compacted = _create_next_collection()
+            count = old.count()
+            for offset in range(0, count, COMPACTION_PAGE_SIZE):
+                page = old.get(limit=COMPACTION_PAGE_SIZE, offset=offset,
+                               include=["embeddings", "documents", "metadatas"])
+                if page["ids"]:
+                    compacted.upsert(ids=page["ids"], embeddings=page["embeddings"],
+                                     documents=page["documents"], metadatas=page["metadatas"])
+            collection = compacted
+            reclaimed, deleted_since_compaction = deleted_since_compaction, 0
+            client.delete_collection(old.name)
+        fact_index.compact()
+    logger.info(f"Compacted index: {count} live chunks kept, {reclaimed} deleted entries reclaimed")
+    return True
+
+def extract_text_from_pdf(pdf_content: bytes, progress: Optional[Callable] = None) -> str:
+    """Extract text content from a PDF file.
+
+    `progress`, if given, is called as `progress(pages_done=..., pages_total=...)` after each page.
+    """
     try:
  
         if not isinstance(pdf_content, bytes):
@@ -55,34 +172,60 @@ def extract_text_from_pdf(pdf_content: bytes) -> str:
             
         pdf_file = io.BytesIO(pdf_content)
         pdf_reader = PyPDF2.PdfReader(pdf_file)
+        pages_total = len(pdf_reader.pages)
         text = ""
-        for page in pdf_reader.pages:
+        for i, page in enumerate(pdf_reader.pages, start=1):
             text += page.extract_text() + "\n"
+            if progress:
+                progress(pages_done=i, pages_total=pages_total)
         return text
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {str(e)}")
         raise
 
-def store_pdf_content(pdf_content: bytes, filename: str):
-    """Store PDF content in the database."""
+def store_pdf_content(pdf_content: bytes, filename: str, progress: Optional[Callable] = None,
+                      throttle: Optional[Callable] = None):
+    """Store PDF content in the database.
+
+    Any chunks and facts previously stored under `filename` are removed first, so a
+    re-uploaded (e.g. revised, shorter) report fully replaces the old one.
+    `progress`, if given, receives page counts during extraction and
+    `chunks_done`/`chunks_total` after each batch. `throttle`, if given, is called
+    before each embedding batch and may block to let higher-priority work run.
+    """
     try:
  
         if not isinstance(pdf_content, bytes):
             logger.error(f"PDF content is not bytes: {type(pdf_content)}")
             raise TypeError(f"PDF content must be bytes, got {type(pdf_content)}")
 
-        text_content = extract_text_from_pdf(pdf_content)
+        with span("ingest_extract"):
+            text_content = extract_text_from_pdf(pdf_content, progress=progress)
         
+        delete_sources([filename])
         
+        with span("ingest_facts"):
+            fact_index.index_document(text_content, filename)
+
         chunks = split_text_into_chunks(text_content)
         
         
-        for i, chunk in enumerate(chunks):
-            collection.add(
-                documents=[chunk],
-                metadatas=[{"source": filename, "chunk": i}],
-                ids=[f"{filename}_chunk_{i}"]
-            )
+        for start in range(0, len(chunks), INGEST_BATCH_SIZE):
+            batch = range(start, min(start + INGEST_BATCH_SIZE, len(chunks)))
+            if throttle:
+                throttle()
+            with span("ingest_embed_store"):
+                documents = [chunks[i] for i in batch]
+                embeddings = embedding_model.encode(documents, batch_size=INGEST_BATCH_SIZE).tolist()
+                with write_lock:
+                    collection.upsert(
+                        documents=documents,
+                        embeddings=embeddings,
+                        metadatas=[{"source": filename, "chunk": i} for i in batch],
+                        ids=[f"{filename}_chunk_{i}" for i in batch]
+                    )
+            if progress:
+                progress(chunks_done=batch.stop, chunks_total=len(chunks))
         
         logger.info(f"Successfully stored PDF content: {filename}")
     except Exception as e:
@@ -110,17 +253,104 @@ def split_text_into_chunks(text: str, chunk_size: int = 1000) -> List[str]:
     
     return chunks
 
-def retrieve_relevant_docs(query: str, n_results: int = 5) -> List[str]:
-    """Retrieve relevant documents from the database based on the query."""
+def mmr_select(query_embedding, embeddings, n_results: int,
+               lambda_mult: float = MMR_LAMBDA,
+               duplicate_similarity: float = DUPLICATE_SIMILARITY,
+               min_relevance_ratio: float = MIN_RELEVANCE_RATIO) -> List[int]:
+    """Pick up to `n_results` candidate indices by maximal marginal relevance.
+
+    Candidates nearly identical to an already selected one are dropped, and selection
+    stops early once the next candidate's relevance falls below `min_relevance_ratio`
+    of the best candidate's.
+    """
+    if len(embeddings) == 0:
+        return []
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    query_vector /= max(np.linalg.norm(query_vector), 1e-12)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    relevance = vectors @ query_vector
+    similarity = vectors @ vectors.T
+    top_relevance = relevance.max()
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    selected = []
+
+    while len(selected) < n_results and available.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if selected and relevance[best] < min_relevance_ratio * top_relevance:
+            break
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+        available &= redundancy < duplicate_similarity
+    return selected
+
+def retrieve_relevant_docs(query: str, n_results: int = 5, sources: Optional[List[str]] = None,
+                           fetch_k: int = MMR_FETCH_K) -> List[str]:
+    """Retrieve relevant documents from the database based on the query.
+
+    `fetch_k` nearest chunks are diversified with MMR and near-duplicates removed, so up
+    to `n_results` distinct chunks are returned. When `sources` is given, only chunks
+    stored under those source names are searched.
+    """
+    return retrieve_relevant_docs_batch([query], n_results, [sources], fetch_k)[0]
+
+def retrieve_relevant_docs_batch(queries: List[str], n_results: int = 5,
+                                 sources_list: Optional[List[Optional[List[str]]]] = None,
+                                 fetch_k: int = MMR_FETCH_K) -> List[List[str]]:
+    """Retrieve documents for many queries, embedding them in one pass.
+
+    Queries sharing the same source scope are searched with a single vector query.
+    `sources_list` gives each query's scope (None searches everything).
+    """
+    sources_list = sources_list or [None] * len(queries)
+    searched = collection
     try:
-        results = collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
-        return results['documents'][0] if results['documents'] else []
+        return _search_batch(searched, queries, n_results, sources_list, fetch_k)
     except Exception as e:
+        if collection is not searched:
+            # Compaction or a clear swapped the collection mid-query; search the new one
+            try:
+                return _search_batch(collection, queries, n_results, sources_list, fetch_k)
+            except Exception as retry_error:
+                e = retry_error
         logger.error(f"Error retrieving documents: {str(e)}")
-        return []
+        return [[] for _ in queries]
+
+def _search_batch(target, queries: List[str], n_results: int,
+                  sources_list: List[Optional[List[str]]], fetch_k: int) -> List[List[str]]:
+    """Run one batched retrieval against `target`."""
+    results = [[] for _ in queries]
+    groups = {}
+    for i, sources in enumerate(sources_list):
+        if sources is not None and not sources:
+            continue
+        groups.setdefault(tuple(sorted(sources)) if sources else None, []).append(i)
+    if not groups:
+        return results
+
+    with span("embed_query"):
+        query_embeddings = embedding_model.encode(list(queries)).tolist()
+    for scope, indices in groups.items():
+        where = {"source": {"$in": list(scope)}} if scope else None
+        with span("vector_search"):
+            found = target.query(
+                query_embeddings=[query_embeddings[i] for i in indices],
+                n_results=max(n_results, fetch_k),
+                where=where,
+                include=["documents", "embeddings"]
+            )
+        with span("mmr_select"):
+            for position, i in enumerate(indices):
+                documents = found['documents'][position] if found['documents'] else []
+                if documents:
+                    selected = mmr_select(query_embeddings[i], found['embeddings'][position], n_results)
+                    results[i] = [documents[j] for j in selected]
+    return results
 
 def chunk_text(text: str, chunk_size: int = 300, chunk_overlap: int = 50) -> List[str]:
     """Splits text into smaller overlapping chunks for better retrieval."""
@@ -130,23 +360,37 @@ def chunk_text(text: str, chunk_size: int = 300, chunk_overlap: int = 50) -> Lis
     return splitter.split_text(text)
 
 def store_data_from_markdown(file_path: str):
-    """Reads markdown file, chunks text, generates embeddings, and stores in ChromaDB."""
+    """Reads markdown file, chunks text, generates embeddings, and stores in ChromaDB.
+
+    Chunks are tagged with the file path as their source. Returns the number of chunks stored.
+    """
     if not os.path.exists(file_path):
         raise FileNotFoundError("Markdown file not found!")
 
     with open(file_path, "r", encoding="utf-8") as file:
         content = file.read()
 
+    fact_index.index_document(content, file_path)
+
     chunks = chunk_text(content)
 
     embeddings = embedding_model.encode(chunks).tolist()
 
-    for i, chunk in enumerate(chunks):
-        doc_id = f"{file_path}-{i}"
-        collection.add(ids=[doc_id], documents=[chunk], embeddings=[embeddings[i]])
+    if chunks:
+        with write_lock:
+            collection.upsert(
+                ids=[f"{file_path}-{i}" for i in range(len(chunks))],
+                documents=chunks,
+                embeddings=embeddings,
+                metadatas=[{"source": file_path, "chunk": i} for i in range(len(chunks))]
+            )
+    return len(chunks)
 
 def load_all_markdown_files():
-    """Loads all markdown files from the documents folder into ChromaDB."""
+    """Loads all markdown files from the documents folder into ChromaDB.
+
+    This re-embeds every file; `document_watcher.sync_documents` indexes only what changed.
+    """
     for file_name in os.listdir(DOCUMENTS_FOLDER):
         if file_name.endswith(".md"):
             file_path = os.path.join(DOCUMENTS_FOLDER, file_name)
@@ -0,0 +1,138 @@
+"""
+Incremental indexing of the documents folder.
+
+A manifest records the mtime, size and content hash of every indexed `.md` and
+`.pdf` file. Each sync pass only stats the folder; files are read, hashed and
+re-embedded only when their mtime or size changed, and index entries of deleted
+files are removed. Files written within the debounce interval are left for a
+later pass, so a burst of writes to one file is indexed once.
+
+The index lives in the serving process's memory, so watching only makes sense
+inside it: set WATCH_DOCUMENTS=1 for the API (or the retrieval service) to run
+`watch()` in a background thread.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict
+
+import database
+from database import DOCUMENTS_FOLDER, delete_sources, store_data_from_markdown, store_pdf_content
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+MANIFEST_PATH = os.path.join("data", "documents_manifest.json")
+WATCHED_EXTENSIONS = (".md", ".pdf")
+POLL_INTERVAL = 2.0
+DEBOUNCE_SECONDS = 1.0
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict:
+    """Load the manifest; it is discarded if it describes a different (e.g. cleared) index."""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("collection_id") == database.index_id:
+            return manifest
+        logger.info("Document manifest belongs to another collection; re-indexing from scratch")
+    return {"collection_id": database.index_id, "files": {}}
+
+
+def save_manifest(manifest: Dict, path: str = MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, path)
+
+
+def index_file(path: str):
+    """(Re-)index one file, dropping any chunks and facts it previously had."""
+    delete_sources([path])
+    if path.endswith(".pdf"):
+        with open(path, "rb") as f:
+            store_pdf_content(f.read(), path)
+    else:
+        store_data_from_markdown(path)
+
+
+def sync_documents(folder: str = DOCUMENTS_FOLDER, manifest: Dict = None,
+                   debounce: float = DEBOUNCE_SECONDS) -> Dict:
+    """Bring the index in line with `folder`. Returns counts of added, updated, removed and pending files."""
+    manifest = manifest if manifest is not None else load_manifest()
+    files = manifest["files"]
+    now = time.time()
+    counts = {"added": 0, "updated": 0, "removed": 0, "pending": 0}
+    seen = set()
+    dirty = False
+
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.is_file() or not entry.name.lower().endswith(WATCHED_EXTENSIONS):
+                continue
+            path = entry.path
+            seen.add(path)
+            stat = entry.stat()
+            known = files.get(path)
+            if known and known["mtime"] == stat.st_mtime and known["size"] == stat.st_size:
+                continue
+            if now - stat.st_mtime < debounce:
+                counts["pending"] += 1
+                continue
+
+            digest = file_hash(path)
+            if not (known and known["sha256"] == digest):
+                try:
+                    index_file(path)
+                except Exception as e:
+                    logger.error(f"Error indexing {path}: {str(e)}")
+                    continue
+                counts["updated" if known else "added"] += 1
+            files[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": digest}
+            dirty = True
+
+    for path in [path for path in files if path not in seen]:
+        delete_sources([path])
+        del files[path]
+        counts["removed"] += 1
+        dirty = True
+
+    if dirty:
+        if counts["added"] or counts["updated"] or counts["removed"]:
+            logger.info(f"Synced {folder}: {counts}")
+        with database.write_lock:
+            # A snapshot import may have replaced the index (and its manifest) meanwhile
+            if manifest["collection_id"] == database.index_id:
+                save_manifest(manifest)
+    return counts
+
+
+def watch(folder: str = DOCUMENTS_FOLDER, interval: float = POLL_INTERVAL,
+          debounce: float = DEBOUNCE_SECONDS):
+    """Poll `folder` forever, syncing the index with what changed.
+
+    The manifest is re-read every pass, so files added to it by a snapshot import are
+    recognized without being re-embedded.
+    """
+    logger.info(f"Watching {folder} every {interval}s")
+    while True:
+        try:
+            sync_documents(folder, debounce=debounce)
+        except Exception as e:
+            logger.error(f"Error syncing {folder}: {str(e)}")
+        time.sleep(interval)
+
@@ -0,0 +1,166 @@
+"""
+Selectable sentence-embedding backend.
+
+EMBEDDING_BACKEND chooses how all-MiniLM-L6-v2 runs on CPU:
+- "torch" (default): the reference SentenceTransformer in full precision
+- "onnx": an ONNX Runtime export of the same model
+- "onnx-int8": the ONNX export with dynamic int8 weight quantization
+
+EMBEDDING_THREADS sets the intra-op thread count (0 leaves the library default).
+The ONNX export and quantized copy are built once and cached under MODELS_FOLDER.
+The ONNX backends need the optional `onnxruntime` package (see requirements.txt).
+Every backend exposes the subset of the SentenceTransformer API the app uses:
+`encode(...)` and `get_sentence_embedding_dimension()`.
+"""
+
+import os
+import logging
+import threading
+from typing import List
+import numpy as np
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MODELS_FOLDER = "models"
+MAX_SEQ_LENGTH = 256
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+class OnnxEmbedder:
+    """Mean-pooled, L2-normalized MiniLM sentence embeddings on ONNX Runtime, with length-sorted batching.
+
+    The reference SentenceTransformer ends with a Normalize layer, so its output is
+    always unit-length; this embedder matches it whatever `normalize_embeddings` says.
+    """
+
+    def __init__(self, model_path: str, tokenizer, threads: int = 0):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = tokenizer
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="np"
+        )
+        feeds = {name: tokens[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False,
+               convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        """Encode sentences; batches are formed from length-sorted inputs to minimize padding."""
+        if isinstance(sentences, str):
+            return self.encode([sentences], batch_size)[0]
+        if not len(sentences):
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        order = np.argsort([-len(sentence) for sentence in sentences], kind="stable")
+        embeddings = np.empty((len(sentences), self.dimension), dtype=np.float32)
+        for start in range(0, len(sentences), batch_size):
+            batch = order[start:start + batch_size]
+            embeddings[batch] = self._encode_batch([sentences[i] for i in batch])
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+
+def export_onnx(quantize: bool = False) -> str:
+    """Export the model to ONNX (and optionally quantize it to int8); returns the model path."""
+    name = MODEL_NAME.split("/")[-1]
+    fp32_path = os.path.join(MODELS_FOLDER, f"{name}.onnx")
+    int8_path = os.path.join(MODELS_FOLDER, f"{name}-int8.onnx")
+    os.makedirs(MODELS_FOLDER, exist_ok=True)
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        logger.info(f"Exporting {MODEL_NAME} to ONNX: {fp32_path}")
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        model = AutoModel.from_pretrained(MODEL_NAME).eval()
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        dynamic_axes = {"input_ids": {0: "batch", 1: "sequence"},
+                        "attention_mask": {0: "batch", 1: "sequence"},
+                        "token_type_ids": {0: "batch", 1: "sequence"},
+                        "last_hidden_state": {0: "batch", 1: "sequence"}}
+        # Written to a per-process temp file and renamed, so workers starting together
+        # never load a half-written model
+        temp_path = f"{fp32_path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+                temp_path,
+                input_names=["input_ids", "attention_mask", "token_type_ids"],
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14
+            )
+        os.replace(temp_path, fp32_path)
+
+    if not quantize:
+        return fp32_path
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing ONNX model to int8: {int8_path}")
+        temp_path = f"{int8_path}.{os.getpid()}.tmp"
+        quantize_dynamic(fp32_path, temp_path, weight_type=QuantType.QInt8)
+        os.replace(temp_path, int8_path)
+    return int8_path
+
+
+def load_embedding_model(backend: str = None, threads: int = None):
+    """Build an embedding model for the given backend (defaults from the environment)."""
+    backend = backend or EMBEDDING_BACKEND
+    threads = EMBEDDING_THREADS if threads is None else threads
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+    if backend == "torch":
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        return SentenceTransformer(MODEL_NAME.split("/")[-1])
+
+    from transformers import AutoTokenizer
+
+    model_path = export_onnx(quantize=backend == "onnx-int8")
+    logger.info(f"Using {backend} embedding backend: {model_path}")
+    return OnnxEmbedder(model_path, AutoTokenizer.from_pretrained(MODEL_NAME), threads)
+
+
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """Return the process-wide embedding model, loading it on first use."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                _embedding_model = load_embedding_model()
+    return _embedding_model
@@ -0,0 +1,162 @@
+"""
+Offline evaluation runner.
+
+Replays a JSONL dataset of queries through the same retrieval + generation path
+as the /chat/ endpoint, with configurable concurrency, and prints the
+ChatbotEvaluator report together with throughput figures.
+
+Each dataset line is a JSON object with a "query" and optionally "ground_truth"
+and "id" (defaults to the line number). Completed queries are appended to a
+checkpoint file, so an interrupted run picks up where it stopped; queries that
+failed are retried.
+
+Example:
+    python evaluate_dataset.py queries.jsonl --concurrency 8 --fake-llm --load-documents
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCORING_BATCH_SIZE = 1024
+
+
+def load_dataset(path: str) -> List[Dict]:
+    """Read the dataset, assigning line-number IDs where none are given."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", line_number)
+            items.append(item)
+    return items
+
+
+def load_checkpoint(path: str) -> Dict:
+    """Return successful results from a previous run, keyed by item ID.
+
+    Failed results (e.g. the LLM was unreachable) are left out so they are retried.
+    """
+    done = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    if result.get("success"):
+                        done[result["id"]] = result
+                    else:
+                        done.pop(result["id"], None)
+    return done
+
+
+def run_item(item: Dict) -> Dict:
+    """Answer one dataset query through the full RAG path and time it."""
+    from chat_pipeline import answer_query
+
+    start_time = time.time()
+    try:
+        result = answer_query(item["query"])
+        response, answered_by = result["response"], result["answered_by"]
+        success = True
+    except Exception as e:
+        logger.error(f"Error answering item {item['id']}: {str(e)}")
+        response, answered_by = f"Error generating response: {str(e)}", None
+        success = False
+    return {
+        "id": item["id"],
+        "query": item["query"],
+        "response": response,
+        "ground_truth": item.get("ground_truth"),
+        "response_time": time.time() - start_time,
+        "success": success,
+        "answered_by": answered_by
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a query dataset through the medical chatbot.")
+    parser.add_argument("dataset", help="JSONL file of {query, ground_truth} objects")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of queries in flight")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint file (default: <dataset>.checkpoint.jsonl)")
+    parser.add_argument("--output", default="evaluation_results.json", help="Evaluation results file")
+    parser.add_argument("--fake-llm", action="store_true",
+                        help="Use the local fake LLM backend instead of Ollama")
+    parser.add_argument("--load-documents", action="store_true",
+                        help="Index the documents folder before replaying")
+    args = parser.parse_args()
+
+    # Imported here so --help stays fast; these load models on import
+    import ollama_chat
+    from database import load_all_markdown_files
+    from evaluation import ChatbotEvaluator
+
+    if args.fake_llm:
+        ollama_chat.LLM_BACKEND = "fake"
+    if args.load_documents:
+        load_all_markdown_files()
+
+    checkpoint_path = args.checkpoint or f"{args.dataset}.checkpoint.jsonl"
+    items = load_dataset(args.dataset)
+    done = load_checkpoint(checkpoint_path)
+    pending = [item for item in items if item["id"] not in done]
+    logger.info(f"{len(items)} queries in dataset, {len(done)} already done, {len(pending)} to run")
+
+    start_time = time.time()
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(run_item, item) for item in pending]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            done[result["id"]] = result
+            checkpoint.write(json.dumps(result) + "\n")
+            checkpoint.flush()
+            if completed % 100 == 0:
+                logger.info(f"{completed}/{len(pending)} queries done")
+    wall_time = time.time() - start_time
+
+    # Score everything in large batches once generation is finished
+    log_path = f"{os.path.splitext(args.output)[0]}.interactions.jsonl"
+    for stale in (log_path, f"{log_path}.emb"):
+        if os.path.exists(stale):
+            os.remove(stale)
+    evaluator = ChatbotEvaluator(log_path=log_path)
+    results = [done[item["id"]] for item in items if item["id"] in done]
+    for start in range(0, len(results), SCORING_BATCH_SIZE):
+        evaluator.log_interactions([
+            {key: result[key] for key in ("query", "response", "ground_truth", "response_time", "success")}
+            for result in results[start:start + SCORING_BATCH_SIZE]
+        ])
+    evaluator.save_evaluation_data(args.output)
+
+    print(evaluator.generate_report())
+    print("Throughput:")
+    print("-----------------------")
+    print(f"Queries run this session: {len(pending)}")
+    print(f"Concurrency: {args.concurrency}")
+    print(f"Wall time: {wall_time:.2f} seconds")
+    if wall_time > 0:
+        print(f"Throughput: {len(pending) / wall_time:.2f} queries/second")
+
+    print("\nAnswering Tiers:")
+    print("-----------------------")
+    tiers = Counter(result.get("answered_by") or "failed" for result in results)
+    for tier, count in tiers.most_common():
+        times = sorted(r["response_time"] for r in results if (r.get("answered_by") or "failed") == tier)
+        print(f"{tier}: {count} ({count / len(results) * 100:.1f}%), "
+              f"median {times[len(times) // 2]:.3f} seconds")
+
+
+if __name__ == "__main__":
+    main()
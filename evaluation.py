@@ -1,81 +1,275 @@
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+from embeddings import get_embedding_model
+import math
 import time
+import threading
 from typing import List, Dict, Tuple
 import json
 import os
+import uuid
 from collections import defaultdict
 
-# Initialize the sentence transformer model for semantic similarity
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Each evaluator appends its interactions as JSON lines to its own log in this
+# folder instead of holding them in memory. Response/ground-truth embeddings go to
+# a raw float32 sidecar (`<log>.emb`), two rows per scored interaction, referenced
+# from the log by `embedding_row`. Results files record each sidecar's row width,
+# so reloading them never needs the embedding model, which is loaded on first encode.
+INTERACTIONS_FOLDER = 'evaluation_logs'
+_log_lock = threading.Lock()
+
+# Texts per forward pass when scoring, and interactions per chunk when reloading
+EMBEDDING_BATCH_SIZE = 256
+LOAD_CHUNK_SIZE = 4096
+
+# Rolling windows reported alongside the lifetime metrics, in seconds
+ROLLING_WINDOWS = {'5m': 300, '1h': 3600}
+
+
+class QuantileSketch:
+    """Constant-memory quantile sketch with bounded relative error.
+
+    Values are counted in logarithmically sized buckets (as in DDSketch / HDR
+    histograms), so any quantile is returned within `relative_accuracy` of the
+    true value and memory depends only on the dynamic range of the data.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-6):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.buckets = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        if value <= self.min_value:
+            self.zero_count += 1
+        else:
+            self.buckets[math.ceil(math.log(value) / self.log_gamma)] += 1
+
+    def merge(self, other: 'QuantileSketch'):
+        for index, bucket_count in other.buckets.items():
+            self.buckets[index] += bucket_count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0
+        # Nearest rank: the smallest value with at least q of the samples at or below it
+        rank = max(0, math.ceil(q * self.count) - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # Midpoint of the bucket (gamma^(i-1), gamma^i] in relative terms
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class RollingSketch:
+    """Quantile sketch over a sliding time window, kept as a ring of per-slot sketches."""
+
+    def __init__(self, window_seconds: float, n_slots: int = 30):
+        self.slot_seconds = window_seconds / n_slots
+        self.slots = [(None, QuantileSketch()) for _ in range(n_slots)]
+
+    def add(self, value: float, now: float = None):
+        slot_id = int((now or time.time()) // self.slot_seconds)
+        position = slot_id % len(self.slots)
+        current_id, sketch = self.slots[position]
+        if current_id is not None and current_id > slot_id:
+            return  # older than the window this slot now holds
+        if current_id != slot_id:
+            sketch = QuantileSketch()
+            self.slots[position] = (slot_id, sketch)
+        sketch.add(value)
+
+    def snapshot(self, now: float = None) -> QuantileSketch:
+        oldest = int((now or time.time()) // self.slot_seconds) - len(self.slots) + 1
+        merged = QuantileSketch()
+        for slot_id, sketch in self.slots:
+            if slot_id is not None and slot_id >= oldest:
+                merged.merge(sketch)
+        return merged
+
 
 class ChatbotEvaluator:
-    def __init__(self):
-        self.response_times = []
-        self.semantic_similarities = []
-        self.query_lengths = []
-        self.response_lengths = []
+    def __init__(self, log_path: str = None):
+        """`log_path` defaults to a new log of this evaluator's own under INTERACTIONS_FOLDER."""
+        if log_path is None:
+            os.makedirs(INTERACTIONS_FOLDER, exist_ok=True)
+            log_path = os.path.join(
+                INTERACTIONS_FOLDER,
+                f"interactions-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl"
+            )
+        self.log_path = log_path
+        # Row width of this evaluator's embeddings sidecar, once it has written one
+        self.embedding_dimension = None
+        # Logs of previously saved results folded in by `load_evaluation_data`
+        self.loaded_logs = []
+        self.response_times = QuantileSketch()
+        self.windowed_response_times = {
+            name: RollingSketch(seconds) for name, seconds in ROLLING_WINDOWS.items()
+        }
+        self.similarity_sum = 0.0
+        self.similarity_count = 0
+        self.query_length_sum = 0
+        self.response_length_sum = 0
         self.successful_queries = 0
         self.failed_queries = 0
         self.total_queries = 0
-        self.evaluation_data = defaultdict(list)
-        
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Encode texts in large batches into L2-normalized float32 embeddings."""
+        return get_embedding_model().encode(
+            texts,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype(np.float32)
+
+    def batch_semantic_similarity(self, responses: List[str],
+                                  ground_truths: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Score many response/ground-truth pairs with one batched encode.
+
+        Returns (scores, response_embeddings, ground_truth_embeddings).
+        """
+        embeddings = self.encode_texts(list(responses) + list(ground_truths))
+        response_embeddings = embeddings[:len(responses)]
+        ground_truth_embeddings = embeddings[len(responses):]
+        scores = np.einsum('ij,ij->i', response_embeddings, ground_truth_embeddings)
+        return scores, response_embeddings, ground_truth_embeddings
+
     def calculate_semantic_similarity(self, text1: str, text2: str) -> float:
         """Calculate semantic similarity between two texts using sentence embeddings."""
         try:
-            embeddings = model.encode([text1, text2])
-            similarity = cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
-            return float(similarity)
+            scores, _, _ = self.batch_semantic_similarity([text1], [text2])
+            return float(scores[0])
         except Exception as e:
             print(f"Error calculating semantic similarity: {e}")
             return 0.0
 
-    def log_interaction(self, query: str, response: str, ground_truth: str = None, 
-                       response_time: float = None, success: bool = True):
-        """Log a single interaction for evaluation."""
+    @property
+    def embeddings_path(self) -> str:
+        return f"{self.log_path}.emb" if self.log_path else None
+
+    def _append_embeddings(self, rows: np.ndarray) -> int:
+        """Append embedding rows to the sidecar file and return the index of the first row."""
+        self.embedding_dimension = rows.shape[1]
+        with open(self.embeddings_path, 'ab') as f:
+            first_row = f.tell() // (rows.shape[1] * 4)
+            f.write(np.ascontiguousarray(rows, dtype=np.float32).tobytes())
+        return first_row
+
+    def _record(self, query: str, response: str, response_time: float = None,
+                success: bool = True, similarity: float = None, timestamp: float = None):
+        """Fold one interaction into the running aggregates."""
         self.total_queries += 1
         if success:
             self.successful_queries += 1
         else:
             self.failed_queries += 1
 
-        # Store query and response lengths
-        self.query_lengths.append(len(query.split()))
-        self.response_lengths.append(len(response.split()))
+        self.query_length_sum += len(query.split())
+        self.response_length_sum += len(response.split())
 
-        # Store response time
         if response_time:
-            self.response_times.append(response_time)
+            self.response_times.add(response_time)
+            if timestamp is not None:
+                for window in self.windowed_response_times.values():
+                    window.add(response_time, timestamp)
 
-        # Calculate semantic similarity if ground truth is provided
-        if ground_truth:
-            similarity = self.calculate_semantic_similarity(response, ground_truth)
-            self.semantic_similarities.append(similarity)
+        if similarity is not None:
+            self.similarity_sum += similarity
+            self.similarity_count += 1
 
-        # Store evaluation data
-        self.evaluation_data['queries'].append({
+    def log_interaction(self, query: str, response: str, ground_truth: str = None,
+                       response_time: float = None, success: bool = True):
+        """Log a single interaction for evaluation."""
+        self.log_interactions([{
             'query': query,
             'response': response,
             'ground_truth': ground_truth,
             'response_time': response_time,
             'success': success
-        })
+        }])
+
+    def log_interactions(self, interactions: List[Dict]):
+        """Log a batch of interactions, scoring all ground-truth pairs in one vectorized pass."""
+        timestamp = time.time()
+        records = [dict(interaction, semantic_similarity=None, timestamp=timestamp)
+                   for interaction in interactions]
+        scored = [record for record in records if record.get('ground_truth')]
+
+        # Calculate semantic similarity where ground truth is provided
+        embeddings = None
+        if scored:
+            try:
+                scores, response_embeddings, ground_truth_embeddings = self.batch_semantic_similarity(
+                    [record['response'] for record in scored],
+                    [record['ground_truth'] for record in scored]
+                )
+                for record, score in zip(scored, scores):
+                    record['semantic_similarity'] = float(score)
+                # Interleave so each interaction owns rows (response, ground truth)
+                embeddings = np.empty((2 * len(scored), response_embeddings.shape[1]), dtype=np.float32)
+                embeddings[0::2] = response_embeddings
+                embeddings[1::2] = ground_truth_embeddings
+            except Exception as e:
+                print(f"Error calculating semantic similarity: {e}")
+
+        for record in records:
+            self._record(record['query'], record['response'], record.get('response_time'),
+                         record.get('success', True), record['semantic_similarity'], timestamp)
+
+        # Append the interactions (and their embeddings) to the on-disk log
+        if self.log_path:
+            with _log_lock:
+                if embeddings is not None:
+                    first_row = self._append_embeddings(embeddings)
+                    for offset, record in enumerate(scored):
+                        record['embedding_row'] = first_row + 2 * offset
+                with open(self.log_path, 'a') as f:
+                    for record in records:
+                        f.write(json.dumps(record) + '\n')
+
+    def _percentiles(self, sketch: QuantileSketch) -> Dict:
+        return {
+            '50th': sketch.quantile(0.50),
+            '90th': sketch.quantile(0.90),
+            '95th': sketch.quantile(0.95)
+        }
 
     def get_metrics(self) -> Dict:
         """Calculate and return all evaluation metrics."""
+        windows = {}
+        for name, window in self.windowed_response_times.items():
+            sketch = window.snapshot()
+            windows[name] = {
+                'count': sketch.count,
+                'average_response_time': sketch.mean(),
+                'response_time_percentiles': self._percentiles(sketch)
+            }
+
         metrics = {
             'total_queries': self.total_queries,
             'success_rate': (self.successful_queries / self.total_queries * 100) if self.total_queries > 0 else 0,
-            'average_response_time': np.mean(self.response_times) if self.response_times else 0,
-            'average_semantic_similarity': np.mean(self.semantic_similarities) if self.semantic_similarities else 0,
-            'average_query_length': np.mean(self.query_lengths) if self.query_lengths else 0,
-            'average_response_length': np.mean(self.response_lengths) if self.response_lengths else 0,
-            'response_time_percentiles': {
-                '50th': np.percentile(self.response_times, 50) if self.response_times else 0,
-                '90th': np.percentile(self.response_times, 90) if self.response_times else 0,
-                '95th': np.percentile(self.response_times, 95) if self.response_times else 0
-            }
+            'average_response_time': self.response_times.mean(),
+            'average_semantic_similarity': self.similarity_sum / self.similarity_count if self.similarity_count else 0,
+            'average_query_length': self.query_length_sum / self.total_queries if self.total_queries else 0,
+            'average_response_length': self.response_length_sum / self.total_queries if self.total_queries else 0,
+            'response_time_percentiles': self._percentiles(self.response_times),
+            'rolling_windows': windows
         }
         return metrics
 
@@ -114,34 +308,118 @@ Response Time Percentiles:
             metrics['response_time_percentiles']['90th'],
             metrics['response_time_percentiles']['95th']
         )
+        for name, window in metrics['rolling_windows'].items():
+            report += """
+Last {} ({} queries):
+-----------------------
+Average Response Time: {:.3f} seconds
+50th / 90th / 95th percentile: {:.3f} / {:.3f} / {:.3f} seconds
+""".format(
+                name,
+                window['count'],
+                window['average_response_time'],
+                window['response_time_percentiles']['50th'],
+                window['response_time_percentiles']['90th'],
+                window['response_time_percentiles']['95th']
+            )
         return report
 
     def save_evaluation_data(self, filename: str = 'evaluation_results.json'):
-        """Save evaluation data to a JSON file."""
+        """Save evaluation metrics to a JSON file.
+
+        Interactions stay in the append-only logs; the file references exactly the
+        logs behind these metrics (this evaluator's own plus any it loaded).
+        """
+        logs = list(self.loaded_logs)
+        if self.log_path:
+            logs.append({'log': self.log_path, 'embeddings': self.embeddings_path,
+                         'dimension': self.embedding_dimension})
         with open(filename, 'w') as f:
             json.dump({
                 'metrics': self.get_metrics(),
-                'interactions': dict(self.evaluation_data)
+                'interactions_logs': logs
             }, f, indent=4)
 
+    @staticmethod
+    def _referenced_logs(data: Dict) -> List[Dict]:
+        """The {log, embeddings, dimension} entries of a results file, including the older single-log form."""
+        if 'interactions_logs' in data:
+            return data['interactions_logs']
+        if data.get('interactions_log'):
+            return [{'log': data['interactions_log'], 'embeddings': data.get('embeddings_file')}]
+        return []
+
+    @staticmethod
+    def _iter_log(log_path: str):
+        if log_path and os.path.exists(log_path):
+            with open(log_path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def _score_chunk(self, chunk: List[Dict], embeddings: np.ndarray = None):
+        """Fill in missing similarity scores for a chunk of loaded interactions.
+
+        Scores come from the persisted embeddings when available; only pairs with
+        neither a stored score nor stored embeddings are re-encoded, in one batch.
+        """
+        missing = [query_data for query_data in chunk
+                   if query_data.get('semantic_similarity') is None and query_data.get('ground_truth')]
+        stored = [query_data for query_data in missing
+                  if embeddings is not None and query_data.get('embedding_row') is not None
+                  and query_data['embedding_row'] + 1 < len(embeddings)]
+        if stored:
+            rows = np.array([query_data['embedding_row'] for query_data in stored])
+            scores = np.einsum('ij,ij->i', embeddings[rows], embeddings[rows + 1])
+            for query_data, score in zip(stored, scores):
+                query_data['semantic_similarity'] = float(score)
+        to_encode = [query_data for query_data in missing if query_data.get('semantic_similarity') is None]
+        if to_encode:
+            scores, _, _ = self.batch_semantic_similarity(
+                [query_data['response'] for query_data in to_encode],
+                [query_data['ground_truth'] for query_data in to_encode]
+            )
+            for query_data, score in zip(to_encode, scores):
+                query_data['semantic_similarity'] = float(score)
+
     def load_evaluation_data(self, filename: str = 'evaluation_results.json'):
         """Load evaluation data from a JSON file."""
         if os.path.exists(filename):
             with open(filename, 'r') as f:
                 data = json.load(f)
-                self.evaluation_data = defaultdict(list, data.get('interactions', {}))
-                # Recalculate metrics based on loaded data
-                for query_data in self.evaluation_data['queries']:
-                    if query_data['success']:
-                        self.successful_queries += 1
-                    else:
-                        self.failed_queries += 1
-                    self.total_queries += 1
-                    if query_data['response_time']:
-                        self.response_times.append(query_data['response_time'])
-                    if query_data['ground_truth']:
-                        similarity = self.calculate_semantic_similarity(
-                            query_data['response'], 
-                            query_data['ground_truth']
-                        )
-                        self.semantic_similarities.append(similarity) 
\ No newline at end of file
+
+            # Legacy results files kept the interactions inline
+            self._load_interactions(data.get('interactions', {}).get('queries', []))
+
+            for entry in self._referenced_logs(data):
+                embeddings = None
+                embeddings_file = entry.get('embeddings')
+                if embeddings_file and os.path.exists(embeddings_file) and os.path.getsize(embeddings_file):
+                    # Results saved before the dimension was recorded still need the model for it
+                    dimension = entry.get('dimension') or get_embedding_model().get_sentence_embedding_dimension()
+                    embeddings = np.memmap(embeddings_file, dtype=np.float32, mode='r').reshape(-1, dimension)
+                self._load_interactions(self._iter_log(entry['log']), embeddings)
+                self.loaded_logs.append(entry)
+
+    def _load_interactions(self, interactions, embeddings: np.ndarray = None):
+        """Recalculate metrics from stored interactions, a bounded chunk at a time."""
+        chunk = []
+        for query_data in interactions:
+            chunk.append(query_data)
+            if len(chunk) >= LOAD_CHUNK_SIZE:
+                self._load_chunk(chunk, embeddings)
+                chunk = []
+        if chunk:
+            self._load_chunk(chunk, embeddings)
+
+    def _load_chunk(self, chunk: List[Dict], embeddings: np.ndarray = None):
+        self._score_chunk(chunk, embeddings)
+        for query_data in chunk:
+            self._record(
+                query_data['query'],
+                query_data['response'],
+                query_data['response_time'],
+                query_data['success'],
+                query_data.get('semantic_similarity'),
+                query_data.get('timestamp')
+            )
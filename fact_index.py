@@ -0,0 +1,328 @@
+"""
+Structured medical fact index.
+
+At ingest time, reports are parsed into simple facts (medications with dosages,
+lab values with units, diagnoses, recommended tests, follow-ups) and stored in a
+small SQLite table indexed by patient and field. Recognized factual questions
+such as "what is my blood pressure?" are then answered straight from the index,
+without retrieval or LLM generation.
+"""
+
+import os
+import re
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# In-memory by default: the facts must live exactly as long as the process's vector
+# collection, which is in-memory too, or one process's facts would answer for another's index
+FACTS_DB_PATH = ":memory:"
+
+MEDICATION = "medication"
+LAB_VALUE = "lab_value"
+DIAGNOSIS = "diagnosis"
+TEST = "test"
+FOLLOW_UP = "follow_up"
+
+# Section headings ("Diagnosis:") whose bullet items become facts of a field
+SECTION_FIELDS = (
+    ("medication", MEDICATION),
+    ("prescri", MEDICATION),
+    ("diagnos", DIAGNOSIS),
+    ("test", TEST),
+)
+
+# Lab keywords mapped to a canonical name, searched for before a value with a known unit
+LAB_NAMES = {
+    "blood pressure": "Blood pressure",
+    "bp": "Blood pressure",
+    "hemoglobin": "Hemoglobin",
+    "haemoglobin": "Hemoglobin",
+    "hba1c": "HbA1c",
+    "glucose": "Blood glucose",
+    "blood sugar": "Blood glucose",
+    "cholesterol": "Cholesterol",
+    "ldl": "LDL cholesterol",
+    "hdl": "HDL cholesterol",
+    "triglycerides": "Triglycerides",
+    "creatinine": "Creatinine",
+    "heart rate": "Heart rate",
+    "pulse": "Heart rate",
+    "temperature": "Temperature",
+    "weight": "Weight",
+    "oxygen saturation": "Oxygen saturation",
+    "spo2": "Oxygen saturation",
+    "tsh": "TSH",
+}
+
+_LAB_KEYWORD = re.compile(r"\b(" + "|".join(re.escape(k) for k in LAB_NAMES) + r")\b")
+_VALUE_WITH_UNIT = re.compile(
+    r"(?P<value>\d+(?:\.\d+)?(?:/\d+)?)\s*(?P<unit>mmHg|g/dL|mg/dL|mmol/L|mEq/L|U/L|ng/mL|bpm|kg|lbs|°[CF]|%)",
+    re.IGNORECASE
+)
+_DOSAGE = re.compile(r"\d+(?:\.\d+)?\s*(?:mg|mcg|µg|g|ml|mL|units?|IU)\b")
+_PATIENT_NAME = re.compile(r"patient name\s*:\s*(?P<name>[^\n]+)", re.IGNORECASE)
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+# Only plain lookups are answered from the index: the whole question must match one
+# of the templates below, so a question that names anything else ("am I taking
+# aspirin?", "what was the date of the test?") goes through RAG and the LLM, as does
+# anything asking for interpretation or advice.
+NEEDS_REASONING = re.compile(
+    r"\b(why|should|normal|mean|means|dangerous|safe|side effects?|cause|causes|treat|improve|lower|raise|risk"
+    r"|interact\w*|doses?|allergic)\b",
+    re.IGNORECASE
+)
+
+# In the templates `{owner}` is "my" or a patient's possessive and `{subject}` is "I"
+# or a patient; stored patient names are replaced by PATIENT_TOKEN before matching.
+PATIENT_TOKEN = "<patient>"
+_OWNER = r"(?:my|<patient>'s|the patient's)"
+_SUBJECT = r"(?:i|<patient>|the patient)"
+_MEDICATIONS = r"(?:medications?|medicines?|drugs?|pills?|prescriptions?)"
+_QUESTION_TEMPLATES = {
+    MEDICATION: (
+        r"(?:what|which) {meds} (?:am i|is {subject}|are {subject}) (?:on|taking|prescribed)",
+        r"(?:what|which) {meds} (?:do i|does {subject}) take",
+        r"(?:what|which) {meds} (?:have i|has {subject}) been prescribed",
+        r"(?:what are|list|show|show me|tell me) {owner} (?:current )?{meds}",
+    ),
+    DIAGNOSIS: (
+        r"what (?:is|are|was|were) {owner} (?:diagnosis|diagnoses|conditions?)",
+        r"what (?:was i|was {subject}|were {subject}) diagnosed with",
+        r"what conditions? (?:do i|does {subject}) have",
+        r"(?:list|show|show me|tell me) {owner} (?:diagnosis|diagnoses|conditions)",
+    ),
+    TEST: (
+        r"(?:what|which) tests? (?:are|were|is|was) recommended(?: for (?:me|{subject}))?",
+        r"(?:what|which) tests? (?:do i|does {subject}) need",
+        r"(?:what are|list|show|show me|tell me) {owner} recommended tests",
+    ),
+    FOLLOW_UP: (
+        r"when is {owner} (?:follow[- ]?up|next appointment)",
+        r"what is {owner} follow[- ]?up(?: plan)?",
+    ),
+    LAB_VALUE: (
+        r"what (?:is|was|are|were) {owner} (?P<lab>{labs})(?: levels?| reading| value)?",
+        r"(?:show|show me|tell me) {owner} (?P<lab>{labs})(?: levels?| reading| value)?",
+    ),
+}
+_QUESTION_PATTERNS = [
+    (re.compile(template.format(meds=_MEDICATIONS, owner=_OWNER, subject=_SUBJECT,
+                                labs="|".join(re.escape(k) for k in LAB_NAMES))), field)
+    for field, templates in _QUESTION_TEMPLATES.items()
+    for template in templates
+]
+
+FIELD_TITLES = {
+    MEDICATION: "Medications",
+    LAB_VALUE: "Lab values",
+    DIAGNOSIS: "Diagnoses",
+    TEST: "Recommended tests",
+    FOLLOW_UP: "Follow-up",
+}
+
+
+def extract_facts(text: str) -> List[Dict]:
+    """Parse report text into a list of facts with `field`, `name`, `value` and `unit`."""
+    facts = []
+    match = _PATIENT_NAME.search(text)
+    patient = match.group("name").strip() if match else None
+
+    section = None
+    prose = []
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if line.endswith(":") and len(line) < 60:
+            heading = line.lower()
+            section = next((field for keyword, field in SECTION_FIELDS if keyword in heading), None)
+            continue
+        if line.startswith(("-", "*", "•")) and section:
+            item = line.lstrip("-*• ").strip()
+            if section == MEDICATION:
+                dosage = _DOSAGE.search(item)
+                facts.append({"field": MEDICATION, "name": item,
+                              "value": dosage.group(0) if dosage else None, "unit": None})
+            else:
+                facts.append({"field": section, "name": item, "value": None, "unit": None})
+            continue
+        section = None
+        prose.append(line)
+
+    # Prose is re-joined so values split across wrapped lines are still found
+    for sentence in _SENTENCE_BOUNDARY.split(" ".join(prose)):
+        lowered = sentence.lower()
+        for value_match in _VALUE_WITH_UNIT.finditer(sentence):
+            before = lowered[:value_match.start()]
+            # The lab named closest before the value is the one it belongs to
+            best = None
+            for match in _LAB_KEYWORD.finditer(before):
+                best = (match.start(), LAB_NAMES[match.group(0)])
+            if best:
+                facts.append({"field": LAB_VALUE, "name": best[1],
+                              "value": value_match.group("value"), "unit": value_match.group("unit")})
+        if re.search(r"\bfollow[- ]?up\b", lowered):
+            facts.append({"field": FOLLOW_UP, "name": sentence.strip(), "value": None, "unit": None})
+
+    for fact in facts:
+        fact["patient"] = patient
+    return facts
+
+
+class FactIndex:
+    """SQLite-backed store of extracted facts, indexed by patient and field."""
+
+    def __init__(self, db_path: str = FACTS_DB_PATH):
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS facts (
+                patient TEXT,
+                field TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value TEXT,
+                unit TEXT,
+                source TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS facts_patient_field ON facts (patient, field);
+            CREATE INDEX IF NOT EXISTS facts_source ON facts (source);
+        """)
+        self._conn.commit()
+
+    def index_document(self, text: str, source: str) -> int:
+        """Replace the facts stored for `source` with those extracted from `text`."""
+        facts = extract_facts(text)
+        with self._lock:
+            self._conn.execute("DELETE FROM facts WHERE source = ?", (source,))
+            self._conn.executemany(
+                "INSERT INTO facts (patient, field, name, value, unit, source) VALUES (?, ?, ?, ?, ?, ?)",
+                [(f["patient"], f["field"], f["name"], f["value"], f["unit"], source) for f in facts]
+            )
+            self._conn.commit()
+        logger.info(f"Indexed {len(facts)} facts from {source}")
+        return len(facts)
+
+    def delete_sources(self, sources: List[str]) -> int:
+        """Delete the facts of the given sources. Returns the number of rows removed."""
+        with self._lock:
+            cursor = self._conn.executemany("DELETE FROM facts WHERE source = ?", [(s,) for s in sources])
+            self._conn.commit()
+        return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM facts")
+            self._conn.commit()
+
+    def compact(self):
+        """Reclaim the space of deleted rows and rebuild the indexes."""
+        with self._lock:
+            self._conn.execute("VACUUM")
+            self._conn.execute("ANALYZE")
+
+    def export_rows(self) -> List[List]:
+        """All stored facts as [patient, field, name, value, unit, source] rows."""
+        with self._lock:
+            return [list(row) for row in self._conn.execute(
+                "SELECT patient, field, name, value, unit, source FROM facts ORDER BY rowid"
+            )]
+
+    def import_rows(self, rows: List[List]):
+        """Bulk-insert rows produced by `export_rows`."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO facts (patient, field, name, value, unit, source) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def patients(self, sources: Optional[List[str]] = None) -> List[str]:
+        query = "SELECT DISTINCT patient FROM facts WHERE patient IS NOT NULL"
+        params = []
+        if sources is not None:
+            query += f" AND source IN ({', '.join('?' * len(sources))})"
+            params = list(sources)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def lookup(self, field: str, patient: Optional[str] = None, name: Optional[str] = None,
+               sources: Optional[List[str]] = None) -> List[Dict]:
+        """Return facts of `field`, optionally narrowed by patient, fact name and source."""
+        query = "SELECT patient, field, name, value, unit, source FROM facts WHERE field = ?"
+        params = [field]
+        if patient is not None:
+            query += " AND patient = ?"
+            params.append(patient)
+        if name is not None:
+            query += " AND name = ?"
+            params.append(name)
+        if sources is not None:
+            query += f" AND source IN ({', '.join('?' * len(sources))})"
+            params.extend(sources)
+        query += " ORDER BY rowid"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(zip(("patient", "field", "name", "value", "unit", "source"), row)) for row in rows]
+
+    def answer(self, question: str, sources: Optional[List[str]] = None) -> Optional[str]:
+        """Answer a recognized factual question from the index, or return None to fall back to RAG."""
+        if sources is not None and not sources:
+            return None
+        if NEEDS_REASONING.search(question):
+            return None
+
+        normalized = " ".join(question.lower().replace("what's", "what is").split()).rstrip("?.! ")
+        patient = None
+        for name in sorted(self.patients(sources), key=len, reverse=True):
+            if name.lower() in normalized:
+                patient = name
+                normalized = normalized.replace(name.lower(), PATIENT_TOKEN)
+                break
+
+        for pattern, field in _QUESTION_PATTERNS:
+            match = pattern.fullmatch(normalized)
+            if match:
+                break
+        else:
+            return None
+        if field == LAB_VALUE:
+            facts = self.lookup(LAB_VALUE, patient=patient, name=LAB_NAMES[match.group("lab")], sources=sources)
+        else:
+            facts = self.lookup(field, patient=patient, sources=sources)
+        if not facts:
+            return None
+        # "my medications" with several patients' reports in scope is ambiguous; let RAG handle it
+        if patient is None and len({fact["patient"] or fact["source"] for fact in facts}) > 1:
+            return None
+        return format_answer(field, facts)
+
+
+def format_answer(field: str, facts: List[Dict]) -> str:
+    """Render facts as a short markdown answer grouped by patient."""
+    by_patient = {}
+    for fact in facts:
+        by_patient.setdefault(fact["patient"] or fact["source"], []).append(fact)
+
+    lines = []
+    for patient, patient_facts in by_patient.items():
+        # Sources may be namespaced (`<session id>/<filename>`); show only the file name
+        sources = ", ".join(sorted({os.path.basename(fact["source"]) for fact in patient_facts}))
+        lines.append(f"**{FIELD_TITLES[field]}** for {patient} (from {sources}):")
+        for fact in patient_facts:
+            if field == LAB_VALUE:
+                lines.append(f"- {fact['name']}: **{fact['value']} {fact['unit']}**")
+            else:
+                lines.append(f"- {fact['name']}")
+    lines.append("")
+    lines.append("Please consult your healthcare provider about what this means for you.")
+    return "\n".join(lines)
@@ -1,27 +1,99 @@
 import gradio as gr
 import os
 import tempfile
-from database import store_pdf_content, retrieve_relevant_docs, clear_database
-from ollama_chat import generate_response
+from database import store_pdf_content
+from retrieval_backend import use_local_retrieval
+from chat_pipeline import route_query, record_answer, TIER_GENERATIVE
+from ollama_chat import stream_response
 from model_instructions import get_system_prompt, get_chat_template
 from evaluation import ChatbotEvaluator
 import PyPDF2
 import io
 import time
+import uuid
+import logging
+import threading
 
-# Initialize session state
-chat_history = []
-documents_processed = False
-evaluator = ChatbotEvaluator()
+# Queue settings. Chat and summary share the LLM budget; uploads get their own,
+# smaller budget so a burst of ingestion cannot starve interactive chat.
+CHAT_CONCURRENCY_LIMIT = 8
+UPLOAD_CONCURRENCY_LIMIT = 2
+QUEUE_MAX_SIZE = 200
+MAX_THREADS = 64
 
-def process_documents(files):
+# Sessions idle this long have their documents deleted; checked every sweep interval
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "3600"))
+SESSION_SWEEP_INTERVAL = 300
+
+logger = logging.getLogger(__name__)
+
+# Uploads are ingested into this process's index, so questions must be answered
+# from it too, never from a shared retrieval service
+retrieval = use_local_retrieval()
+
+# Live sessions by id; closed browser tabs are never reported, so idle ones are swept
+sessions = {}
+sessions_lock = threading.Lock()
+
+def new_session():
+    """Create the per-browser-session state.
+
+    Documents are stored under `<session id>/<filename>`, so sessions uploading
+    files with the same name never overwrite, see or delete each other's data.
+    """
+    session = {
+        "id": uuid.uuid4().hex,
+        "sources": [],
+        "evaluator": ChatbotEvaluator(),
+        "last_active": time.time()
+    }
+    with sessions_lock:
+        sessions[session["id"]] = session
+    return session
+
+def touch(session):
+    """Mark a session active; one whose documents were swept starts over without them."""
+    with sessions_lock:
+        if session["id"] not in sessions:
+            session["sources"] = []
+        session["last_active"] = time.time()
+        sessions[session["id"]] = session
+
+def sweep_idle_sessions(now=None):
+    """Delete the documents of sessions idle longer than SESSION_IDLE_SECONDS."""
+    cutoff = (now or time.time()) - SESSION_IDLE_SECONDS
+    with sessions_lock:
+        idle = [session for session in sessions.values() if session["last_active"] < cutoff]
+        for session in idle:
+            del sessions[session["id"]]
+    for session in idle:
+        try:
+            if session["sources"]:
+                retrieval.delete_sources(session["sources"])
+            session["sources"] = []
+        except Exception as e:
+            logger.error(f"Error deleting documents of idle session {session['id']}: {str(e)}")
+    if idle:
+        logger.info(f"Swept {len(idle)} idle session(s)")
+
+def sweep_idle_sessions_periodically():
+    while True:
+        time.sleep(SESSION_SWEEP_INTERVAL)
+        sweep_idle_sessions()
+
+threading.Thread(target=sweep_idle_sessions_periodically, daemon=True, name="session-sweeper").start()
+
+def process_documents(files, session):
     """Process uploaded PDF documents."""
-    global documents_processed
+    touch(session)
     if not files:
-        return "No files uploaded.", False
+        yield "No files uploaded.", session
+        return
     
     try:
-        for file in files:
+        for index, file in enumerate(files, start=1):
+            filename = os.path.basename(file.name)
+            yield f"Processing {filename} ({index}/{len(files)})...", session
             # Convert Gradio file to bytes
             if hasattr(file, 'name'):
                 # For newer Gradio versions
@@ -31,18 +103,22 @@ def process_documents(files):
                 # For older Gradio versions
                 file_bytes = file
             
-            # Process the PDF
-            store_pdf_content(file_bytes, os.path.basename(file.name))
+            # Process the PDF under this session's namespace
+            source = f"{session['id']}/{filename}"
+            store_pdf_content(file_bytes, source)
+            if source not in session["sources"]:
+                session["sources"].append(source)
         
-        documents_processed = True
-        return "All documents processed successfully!", True
+        yield "All documents processed successfully!", session
     except Exception as e:
-        return f"Error processing documents: {str(e)}", False
+        yield f"Error processing documents: {str(e)}", session
 
-def generate_summary():
+def generate_summary(session):
     """Generate summary of processed documents."""
-    if not documents_processed:
-        return "Please upload medical documents first."
+    touch(session)
+    if not session["sources"]:
+        yield "Please upload medical documents first."
+        return
     
     try:
         start_time = time.time()
@@ -64,32 +140,45 @@ def generate_summary():
         )
         
         # Generate summary
-        summary = generate_response(summary_prompt, "")
+        summary = ""
+        for piece in stream_response(summary_prompt, ""):
+            summary += piece
+            yield summary
         response_time = time.time() - start_time
         
         # Log the interaction
-        evaluator.log_interaction(
+        session["evaluator"].log_interaction(
             query="generate_summary",
             response=summary,
             response_time=response_time
         )
-        
-        return summary
     except Exception as e:
-        return f"Error generating summary: {str(e)}"
+        yield f"Error generating summary: {str(e)}"
 
-def respond(message, history):
+def respond(message, history, session):
     """Generate response for user questions."""
-    global documents_processed
-    
-    if not documents_processed:
-        return history + [[message, "Please upload medical documents first to get personalized responses."]]
+    touch(session)
+    if not session["sources"]:
+        yield history + [[message, "Please upload medical documents first to get personalized responses."]]
+        return
     
     try:
         start_time = time.time()
-        # Retrieve relevant medical information
-        relevant_docs = retrieve_relevant_docs(message)
-        context = "\n".join(relevant_docs) if relevant_docs else ""
+        tier_start = time.perf_counter()
+        # Fact and extractive tiers, then compressed context from this session's documents
+        routed = route_query(message, sources=session["sources"])
+        if routed["response"] is not None:
+            response = record_answer(routed["tier"], tier_start, routed["response"],
+                                     routed["relevant_docs"])["response"]
+            session["evaluator"].log_interaction(
+                query=message,
+                response=response,
+                response_time=time.time() - start_time
+            )
+            yield history + [[message, response]]
+            return
+
+        context = routed["context"]
         
         # Get the medical chatbot system prompt
         system_prompt = get_system_prompt()
@@ -114,49 +203,51 @@ Guidelines for your response:
 6. Include appropriate medical disclaimers when needed"""
         )
         
-        # Generate response
-        response = generate_response(prompt, context)
+        # Stream the response into the chat window
+        response = ""
+        for piece in stream_response(prompt, context):
+            response += piece
+            yield history + [[message, response]]
         response_time = time.time() - start_time
+        record_answer(TIER_GENERATIVE, tier_start, response, routed["relevant_docs"])
         
         # Log the interaction
-        evaluator.log_interaction(
+        session["evaluator"].log_interaction(
             query=message,
             response=response,
             response_time=response_time
         )
-        
-        return history + [[message, response]]
     except Exception as e:
         error_msg = f"Error generating response: {str(e)}"
-        evaluator.log_interaction(
+        session["evaluator"].log_interaction(
             query=message,
             response=error_msg,
             success=False
         )
-        return history + [[message, error_msg]]
+        yield history + [[message, error_msg]]
 
-def get_evaluation_metrics():
+def get_evaluation_metrics(session):
     """Get current evaluation metrics."""
-    return evaluator.generate_report()
+    return session["evaluator"].generate_report()
 
-def save_metrics():
+def save_metrics(session):
     """Save evaluation metrics to file."""
     try:
-        evaluator.save_evaluation_data()
+        session["evaluator"].save_evaluation_data()
         return "Evaluation metrics saved successfully!"
     except Exception as e:
         return f"Error saving metrics: {str(e)}"
 
-def clear_all():
-    """Clear all data and reset the application."""
-    global documents_processed, chat_history
+def clear_all(session):
+    """Clear this session's documents and reset its state."""
     try:
-        clear_database()
-        documents_processed = False
-        chat_history = []
-        return "All data cleared successfully!", [], "", ""
+        retrieval.delete_sources(session["sources"])
+        with sessions_lock:
+            sessions.pop(session["id"], None)
+        session = new_session()
+        return "All data cleared successfully!", [], "", "", session
     except Exception as e:
-        return f"Error clearing data: {str(e)}", [], "", ""
+        return f"Error clearing data: {str(e)}", [], "", "", session
 
 # Create the Gradio interface
 with gr.Blocks(title="Medical Assistant", theme=gr.themes.Soft()) as demo:
@@ -226,25 +317,36 @@ with gr.Blocks(title="Medical Assistant", theme=gr.themes.Soft()) as demo:
                 clear = gr.Button("Clear Chat")
     
     # Set up event handlers
+    session = gr.State()
+    demo.load(new_session, outputs=session, queue=False)
+
     upload_button.upload(
         process_documents,
-        inputs=[upload_button],
-        outputs=[file_output, gr.State(False)]
+        inputs=[upload_button, session],
+        outputs=[file_output, session],
+        concurrency_limit=UPLOAD_CONCURRENCY_LIMIT,
+        concurrency_id="upload"
     )
     
     summary_button.click(
         generate_summary,
-        outputs=summary_output
+        inputs=session,
+        outputs=summary_output,
+        concurrency_limit=CHAT_CONCURRENCY_LIMIT,
+        concurrency_id="llm"
     )
     
     msg.submit(
         respond,
-        inputs=[msg, chatbot],
-        outputs=[chatbot]
+        inputs=[msg, chatbot, session],
+        outputs=[chatbot],
+        concurrency_limit=CHAT_CONCURRENCY_LIMIT,
+        concurrency_id="llm"
     ).then(
         lambda: "",  # This clears the text box after sending
         None,
-        msg
+        msg,
+        queue=False
     )
     
     clear.click(
@@ -256,19 +358,31 @@ with gr.Blocks(title="Medical Assistant", theme=gr.themes.Soft()) as demo:
     
     clear_btn.click(
         clear_all,
-        outputs=[file_output, chatbot, summary_output, metrics_output]
+        inputs=session,
+        outputs=[file_output, chatbot, summary_output, metrics_output, session],
+        concurrency_limit=UPLOAD_CONCURRENCY_LIMIT,
+        concurrency_id="upload"
     )
     
     update_metrics.click(
         get_evaluation_metrics,
-        outputs=metrics_output
+        inputs=session,
+        outputs=metrics_output,
+        queue=False
     )
     
     save_metrics_btn.click(
         save_metrics,
-        outputs=file_output
+        inputs=session,
+        outputs=file_output,
+        queue=False
     )
 
+demo.queue(
+    default_concurrency_limit=CHAT_CONCURRENCY_LIMIT,
+    max_size=QUEUE_MAX_SIZE
+)
+
 # Launch the application
 if __name__ == "__main__":
-    demo.launch(share=False)
\ No newline at end of file
+    demo.launch(share=False, max_threads=MAX_THREADS)
@@ -0,0 +1,178 @@
+"""
+Index snapshots for fast replica provisioning.
+
+A snapshot is a directory holding everything a serving node needs, so it can be
+brought up without re-running ingestion or any embedding work:
+
+    manifest.json    format version, embedding model/dimension, record count, checksums
+    embeddings.npy   float32 matrix, one row per chunk (loaded memory-mapped)
+    records.jsonl    one {"id", "document", "metadata"} object per chunk, in row order
+    facts.json       rows of the structured fact index
+    documents_manifest.json
+                     the document watcher's manifest of indexed files, re-keyed to the
+                     new index on import so the watcher does not re-embed them
+
+The collection lives in the serving process's memory, so snapshots are taken and
+loaded there: through the /snapshots endpoints of the API or retrieval service
+(named snapshots under SNAPSHOTS_FOLDER), or at startup via INDEX_SNAPSHOT.
+Writes to the index are held off while a snapshot is exported or imported.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict
+
+import numpy as np
+
+import database
+import document_watcher
+from database import embedding_model, fact_index
+from embeddings import EMBEDDING_BACKEND, MODEL_NAME
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+SNAPSHOTS_FOLDER = "snapshots"
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_FILES = ("embeddings.npy", "records.jsonl", "facts.json", "documents_manifest.json")
+EXPORT_PAGE_SIZE = 1000
+IMPORT_BATCH_SIZE = 5000
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_path(name: str) -> str:
+    """Path of a named snapshot under SNAPSHOTS_FOLDER; rejects names that would escape it."""
+    if not name or name in (".", "..") or os.path.basename(name) != name or "\\" in name:
+        raise ValueError(f"Invalid snapshot name: {name!r}")
+    return os.path.join(SNAPSHOTS_FOLDER, name)
+
+
+def export_snapshot(path: str) -> Dict:
+    """Write the current collection and fact index to a snapshot directory. Returns its manifest."""
+    with database.write_lock:
+        os.makedirs(path, exist_ok=True)
+        collection = database.collection
+        count = collection.count()
+        dimension = embedding_model.get_sentence_embedding_dimension()
+
+        embeddings = np.lib.format.open_memmap(
+            os.path.join(path, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(count, dimension)
+        )
+        written = 0
+        with open(os.path.join(path, "records.jsonl"), "w", encoding="utf-8") as records:
+            while written < count:
+                page = collection.get(
+                    limit=EXPORT_PAGE_SIZE,
+                    offset=written,
+                    include=["embeddings", "documents", "metadatas"]
+                )
+                if not page["ids"]:
+                    break
+                embeddings[written:written + len(page["ids"])] = np.asarray(page["embeddings"], dtype=np.float32)
+                for record_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    records.write(json.dumps({"id": record_id, "document": document, "metadata": metadata}) + "\n")
+                written += len(page["ids"])
+        embeddings.flush()
+        del embeddings
+        if written != count:
+            raise RuntimeError(f"Collection changed during export: expected {count} records, read {written}")
+
+        with open(os.path.join(path, "facts.json"), "w", encoding="utf-8") as f:
+            json.dump(fact_index.export_rows(), f)
+        with open(os.path.join(path, "documents_manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(document_watcher.load_manifest()["files"], f)
+
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "created_at": time.time(),
+            "embedding_model": MODEL_NAME,
+            "embedding_backend": EMBEDDING_BACKEND,
+            "dimension": dimension,
+            "count": count,
+            "checksums": {name: _sha256(os.path.join(path, name)) for name in SNAPSHOT_FILES
+                          if os.path.exists(os.path.join(path, name))}
+        }
+        with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+        logger.info(f"Exported {count} chunks to snapshot {path}")
+        return manifest
+
+
+def import_snapshot(path: str, replace: bool = True, verify: bool = True) -> Dict:
+    """Load a snapshot into the collection and fact index with bulk writes. Returns its manifest."""
+    with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+    if manifest["embedding_model"] != MODEL_NAME:
+        raise ValueError(f"Snapshot was built with {manifest['embedding_model']}, this node uses {MODEL_NAME}")
+    if verify:
+        for name, checksum in manifest["checksums"].items():
+            if _sha256(os.path.join(path, name)) != checksum:
+                raise ValueError(f"Checksum mismatch for {name} in snapshot {path}")
+
+    embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    if embeddings.shape != (manifest["count"], manifest["dimension"]):
+        raise ValueError(f"Snapshot embeddings have shape {embeddings.shape}, manifest says "
+                         f"({manifest['count']}, {manifest['dimension']})")
+
+    with open(os.path.join(path, "facts.json"), "r", encoding="utf-8") as f:
+        fact_rows = json.load(f)
+
+    with database.write_lock:
+        if replace:
+            database.clear_database()
+        else:
+            # Drop the live copies of merged documents first, so chunks beyond the
+            # snapshot copy's length do not linger
+            sources = {row[5] for row in fact_rows}
+            with open(os.path.join(path, "records.jsonl"), "r", encoding="utf-8") as records:
+                for line in records:
+                    sources.add((json.loads(line)["metadata"] or {}).get("source"))
+            sources.discard(None)
+            database.delete_sources(sorted(sources))
+        collection = database.collection
+
+        def flush(batch, start):
+            collection.upsert(
+                ids=[record["id"] for record in batch],
+                documents=[record["document"] for record in batch],
+                metadatas=[record["metadata"] for record in batch],
+                embeddings=embeddings[start:start + len(batch)].tolist()
+            )
+
+        batch, start = [], 0
+        with open(os.path.join(path, "records.jsonl"), "r", encoding="utf-8") as records:
+            for line in records:
+                batch.append(json.loads(line))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    flush(batch, start)
+                    start += len(batch)
+                    batch = []
+        if batch:
+            flush(batch, start)
+        fact_index.import_rows(fact_rows)
+
+        # Snapshots from before the watcher manifest was included simply have none
+        manifest_path = os.path.join(path, "documents_manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                files = json.load(f)
+            documents_manifest = document_watcher.load_manifest()
+            documents_manifest["files"].update(files)
+            document_watcher.save_manifest(documents_manifest)
+    logger.info(f"Imported {manifest['count']} chunks from snapshot {path}")
+    return manifest
+
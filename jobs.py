@@ -0,0 +1,225 @@
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, BinaryIO
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+JOBS_DB_PATH = os.path.join("data", "jobs.sqlite3")
+UPLOADS_FOLDER = "uploads"
+
+# Finished (completed or failed) jobs are kept this long for status polling
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+JOB_FIELDS = (
+    "id", "filename", "path", "status", "attempts", "pages_done", "pages_total",
+    "chunks_done", "chunks_total", "error", "created_at", "updated_at"
+)
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue already holds its maximum number of pending jobs."""
+
+
+class IngestionJobQueue:
+    """Bounded worker pool that ingests uploaded files in the background.
+
+    Job state lives in a small SQLite table so queued and interrupted jobs are
+    picked up again by `start()` after a restart. `ingest` is called as
+    `ingest(content, filename, progress=..., throttle=...)`; `throttle`, if given,
+    is called before each embedding batch so higher-priority work can go first.
+    Jobs for the same filename run one at a time, in the order they were picked up,
+    since each replaces the chunks the previous one stored under that name.
+    """
+
+    def __init__(self, ingest: Callable, db_path: str = JOBS_DB_PATH,
+                 uploads_folder: str = UPLOADS_FOLDER, max_workers: int = 2,
+                 max_pending: int = 100, max_attempts: int = 3, retry_delay: float = 2.0,
+                 throttle: Optional[Callable[[], None]] = None,
+                 retention_seconds: float = JOB_RETENTION_SECONDS):
+        self.ingest = ingest
+        self.retention_seconds = retention_seconds
+        self.throttle = throttle
+        self.uploads_folder = uploads_folder
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._executor = None
+        self._lock = threading.Lock()
+        # filename -> {"next": next ticket, "serving": ticket allowed to run, "turn": Condition}
+        self._filename_turns = {}
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        os.makedirs(uploads_folder, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                pages_total INTEGER NOT NULL DEFAULT 0,
+                chunks_done INTEGER NOT NULL DEFAULT 0,
+                chunks_total INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def start(self):
+        """Start the worker pool and re-enqueue jobs left over from a previous run."""
+        self.prune()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING)
+            ).fetchall()
+        for (job_id,) in rows:
+            self._update(job_id, status=QUEUED)
+            self._executor.submit(self._run, job_id)
+        if rows:
+            logger.info(f"Resumed {len(rows)} ingestion job(s)")
+
+    def shutdown(self, wait: bool = False):
+        """Stop accepting work. Unfinished jobs stay queued for the next `start()`."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, fileobj: BinaryIO, filename: str) -> str:
+        """Spool an uploaded file to disk and enqueue it for ingestion. Returns the job ID."""
+        if self._executor is None:
+            raise RuntimeError("Ingestion queue is not running. Call `start()` first.")
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchone()[0]
+        if pending >= self.max_pending:
+            raise QueueFullError(f"Ingestion queue is full ({pending} pending jobs)")
+
+        self.prune()
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.uploads_folder, f"{job_id}_{os.path.basename(filename)}")
+        with open(path, "wb") as out:
+            shutil.copyfileobj(fileobj, out)
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, filename, path, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, filename, path, QUEUED, now, now)
+            )
+            self._conn.commit()
+        self._executor.submit(self._run, job_id)
+        logger.info(f"Queued ingestion job {job_id} for {filename}")
+        return job_id
+
+    def prune(self) -> int:
+        """Drop finished jobs older than the retention period. Returns how many were removed."""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (COMPLETED, FAILED, cutoff)
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Pruned {cursor.rowcount} finished ingestion job(s)")
+        return cursor.rowcount
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return the job record, or None if the ID is unknown."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        del job["path"]
+        return job
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+            )
+            self._conn.commit()
+
+    @contextmanager
+    def _filename_turn(self, filename: str):
+        """Hold the enclosed block until earlier jobs for `filename` are done."""
+        with self._lock:
+            state = self._filename_turns.setdefault(
+                filename, {"next": 0, "serving": 0, "turn": threading.Condition(self._lock)}
+            )
+            ticket = state["next"]
+            state["next"] += 1
+            while state["serving"] != ticket:
+                state["turn"].wait()
+        try:
+            yield
+        finally:
+            with self._lock:
+                state["serving"] += 1
+                if state["serving"] == state["next"]:
+                    del self._filename_turns[filename]
+                else:
+                    state["turn"].notify_all()
+
+    def _run(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename, path, attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        filename = row[0]
+        # Two versions of one file ingested at once would interleave their deletes and
+        # upserts of `{filename}_chunk_{i}`, leaving the longer version's tail behind
+        with self._filename_turn(filename):
+            self._run_attempts(job_id, *row)
+
+    def _run_attempts(self, job_id: str, filename: str, path: str, attempts: int):
+        def progress(**counts):
+            self._update(job_id, **counts)
+
+        while attempts < self.max_attempts:
+            attempts += 1
+            self._update(job_id, status=RUNNING, attempts=attempts, error=None)
+            try:
+                with open(path, "rb") as f:
+                    content = f.read()
+                self.ingest(content, filename, progress=progress, throttle=self.throttle)
+                self._update(job_id, status=COMPLETED)
+                os.remove(path)
+                logger.info(f"Ingestion job {job_id} completed")
+                return
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} attempt {attempts} failed: {str(e)}")
+                self._update(job_id, error=str(e))
+                if attempts < self.max_attempts:
+                    time.sleep(self.retry_delay * attempts)
+
+        self._update(job_id, status=FAILED)
+        if os.path.exists(path):
+            os.remove(path)
@@ -1,13 +1,17 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from database import store_pdf_content, retrieve_relevant_docs, clear_database
-from ollama_chat import generate_response
+from fastapi.concurrency import run_in_threadpool
+from jobs import QueueFullError
+from retrieval_backend import get_retrieval_backend, RetrievalServiceError
+from chat_pipeline import answer_query
+from singleflight import SingleFlight, chat_key
+from admission import AdmissionController, Overloaded, INTERACTIVE, EVALUATION, BULK
 from typing import Optional, List
 import os
 import logging
-from fastapi.responses import JSONResponse
-from model_instructions import get_system_prompt, get_chat_template
+from fastapi.responses import JSONResponse, PlainTextResponse
+from tracing import render_prometheus
 
 
 logging.basicConfig(level=logging.INFO)
@@ -35,24 +39,57 @@ class ChatResponse(BaseModel):
     response: str
     context_used: bool
     relevant_docs_count: int
+    answered_by: str = "generative"
+
+class DeleteDocumentsRequest(BaseModel):
+    sources: List[str]
 
 DOCUMENTS_FOLDER = "documents"
 os.makedirs(DOCUMENTS_FOLDER, exist_ok=True)
 
+# In-process index and ingestion, or a client of the shared retrieval service
+# when RETRIEVAL_SERVICE_URL is set (lets this app run as several stateless workers)
+retrieval = get_retrieval_backend()
+
+# Identical concurrent chat queries share one retrieval and one LLM generation
+chat_flights = SingleFlight("chat")
+
+# Per-class priority queues and concurrency budgets; chat is served ahead of
+# evaluation replays and uploads, and background ingestion yields to chat. These
+# budgets are per worker: with RETRIEVAL_SERVICE_URL set, the retrieval service
+# admits the retrieval calls of all workers against one budget and throttles its
+# own ingestion, answering 429 (passed on here as Overloaded) when overloaded.
+admission = AdmissionController()
+
+def overloaded_response(e: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+async def run_admitted(traffic_class: str, fn):
+    async with admission.admit(traffic_class):
+        return await fn()
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize the application on startup."""
     try:
         
-        clear_database()
-        logger.info("Database cleared and initialized successfully")
+        retrieval.start(throttle=lambda: admission.wait_for_idle(INTERACTIVE))
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         raise
 
-@app.post("/upload/")
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the ingestion workers; unfinished jobs resume on next startup."""
+    retrieval.shutdown()
+
+@app.post("/upload/", status_code=202)
 async def upload_file(file: UploadFile = File(...)):
-    """Uploads a medical PDF document and stores its content in ChromaDB."""
+    """Queues a medical PDF document for background ingestion into ChromaDB."""
     try:
         if not file.filename.endswith('.pdf'):
             raise HTTPException(
@@ -60,20 +97,29 @@ async def upload_file(file: UploadFile = File(...)):
                 detail="Only PDF files (.pdf) are allowed"
             )
 
-        content = await file.read()
+        async with admission.admit(BULK):
+            job_id = await run_in_threadpool(retrieval.submit_upload, file.file, file.filename)
         
-       
-        store_pdf_content(content, file.filename)
-        
-        logger.info(f"Successfully uploaded and stored file: {file.filename}")
+        logger.info(f"Queued file for ingestion: {file.filename} (job {job_id})")
         
         return JSONResponse(
-            status_code=200,
+            status_code=202,
             content={
-                "message": "Medical document uploaded and processed successfully",
-                "filename": file.filename
+                "message": "Medical document queued for processing",
+                "filename": file.filename,
+                "job_id": job_id,
+                "status_url": f"/jobs/{job_id}"
             }
         )
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise overloaded_response(e)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
         raise HTTPException(
@@ -81,9 +127,144 @@ async def upload_file(file: UploadFile = File(...)):
             detail=f"Error processing medical document: {str(e)}"
         )
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Reports the status and page/chunk progress of an ingestion job."""
+    try:
+        job = await run_in_threadpool(retrieval.get_job, job_id)
+    except RetrievalServiceError as e:
+        logger.error(f"Error fetching job status: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown job: {job_id}"
+        )
+    return job
+
+@app.get("/documents")
+async def list_documents():
+    """Lists the stored documents (sources) with their chunk counts."""
+    try:
+        counts = await run_in_threadpool(retrieval.list_documents)
+        return {
+            "documents": [{"source": source, "chunks": chunks} for source, chunks in sorted(counts.items())]
+        }
+    except Exception as e:
+        logger.error(f"Error listing documents: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error listing documents: {str(e)}"
+        )
+
+@app.delete("/documents/{source:path}")
+async def delete_document(source: str):
+    """Removes one document's chunks and extracted facts from the index."""
+    try:
+        deleted = await run_in_threadpool(retrieval.delete_sources, [source])
+    except Exception as e:
+        logger.error(f"Error deleting document: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error deleting document: {str(e)}"
+        )
+    if not deleted["chunks"] and not deleted["facts"]:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown document: {source}"
+        )
+    logger.info(f"Deleted document {source}: {deleted}")
+    return {"source": source, "deleted_chunks": deleted["chunks"], "deleted_facts": deleted["facts"]}
+
+@app.post("/documents/delete")
+async def delete_documents(request: DeleteDocumentsRequest):
+    """Removes the chunks and extracted facts of several documents (sources) at once."""
+    try:
+        deleted = await run_in_threadpool(retrieval.delete_sources, request.sources)
+        logger.info(f"Deleted {len(request.sources)} documents: {deleted}")
+        return {"sources": request.sources, "deleted_chunks": deleted["chunks"], "deleted_facts": deleted["facts"]}
+    except Exception as e:
+        logger.error(f"Error deleting documents: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error deleting documents: {str(e)}"
+        )
+
+@app.post("/index/compact")
+async def compact_index(force: bool = False):
+    """Rebuilds the index without its deleted entries; skipped below the threshold unless forced."""
+    try:
+        async with admission.admit(BULK):
+            compacted = await run_in_threadpool(retrieval.compact, force)
+        return {"compacted": compacted}
+    except Overloaded as e:
+        raise overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error compacting index: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error compacting index: {str(e)}"
+        )
+
+@app.post("/snapshots/{name}/export")
+async def export_snapshot(name: str):
+    """Writes the live index to a named snapshot, for provisioning replicas."""
+    try:
+        async with admission.admit(BULK):
+            manifest = await run_in_threadpool(retrieval.export_snapshot, name)
+        logger.info(f"Exported index snapshot {name}")
+        return manifest
+    except Overloaded as e:
+        raise overloaded_response(e)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Error exporting snapshot: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error exporting snapshot: {str(e)}"
+        )
+
+@app.post("/snapshots/{name}/import")
+async def import_snapshot(name: str, merge: bool = False, verify: bool = True):
+    """Loads a named snapshot into the live index, replacing it unless `merge` is set."""
+    try:
+        async with admission.admit(BULK):
+            manifest = await run_in_threadpool(retrieval.import_snapshot, name, merge, verify)
+        logger.info(f"Imported index snapshot {name}")
+        return manifest
+    except Overloaded as e:
+        raise overloaded_response(e)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(
+            status_code=404,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Error importing snapshot: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error importing snapshot: {str(e)}"
+        )
+
 @app.post("/chat/", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Processes medical queries and generates responses using Llama 3.2 with RAG model."""
+async def chat(request: ChatRequest, x_traffic_class: Optional[str] = Header(None)):
+    """Processes medical queries and generates responses using Llama 3.2 with RAG model.
+
+    Evaluation replays should send `X-Traffic-Class: evaluation` so they queue behind patient chat.
+    """
+    traffic_class = EVALUATION if x_traffic_class == EVALUATION else INTERACTIVE
     try:
         if not request.query.strip():
             raise HTTPException(
@@ -92,44 +273,19 @@ async def chat(request: ChatRequest):
             )
 
        
-        relevant_docs = retrieve_relevant_docs(request.query)
-        has_context = bool(relevant_docs)
-        context = "\n".join(relevant_docs) if relevant_docs else "No relevant medical information found in the database."
-
-        
-        system_prompt = get_system_prompt()
-        chat_template = get_chat_template()
-
-    
-        prompt = chat_template.format(
-            system_prompt=system_prompt,
-            user_message=f"""Based on the following medical information:
-
-CONTEXT:
-{context}
-
-Please provide a detailed medical response to: {request.query}
-
-Guidelines for your response:
-1. If the context contains relevant medical information, use it to provide a comprehensive answer
-2. Explain medical terms in simple language
-3. Include relevant medical details from the context
-4. If the context doesn't contain relevant information, acknowledge this and provide general medical guidance
-5. Always maintain a professional medical tone
-6. Include appropriate medical disclaimers
-7. Suggest consulting healthcare providers when appropriate"""
+        result = await chat_flights.do(
+            (traffic_class, chat_key(request.query)),
+            lambda: run_admitted(traffic_class, lambda: run_in_threadpool(answer_query, request.query))
         )
-
-        response = generate_response(prompt, context)
         
         logger.info(f"Successfully generated medical response for query: {request.query[:50]}...")
         
-        return ChatResponse(
-            response=response,
-            context_used=has_context,
-            relevant_docs_count=len(relevant_docs)
-        )
+        return ChatResponse(**result)
 
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise overloaded_response(e)
     except Exception as e:
         logger.error(f"Error processing medical query: {str(e)}")
         raise HTTPException(
@@ -137,6 +293,14 @@ Guidelines for your response:
             detail=f"Error generating medical response: {str(e)}"
         )
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Expose per-stage latency histograms in the Prometheus text format."""
+    return PlainTextResponse(
+        render_prometheus(),
+        media_type="text/plain; version=0.0.4"
+    )
+
 @app.get("/health")
 async def health_check():
     """Check if the API is running and ready to accept requests."""
@@ -49,3 +49,31 @@ class MedicalQAModel:
 
         return result.get('answer', 'No answer found.')
 
+    def answer_from_contexts(self, question, contexts):
+        """
+        Extract the best-scoring answer span across several candidate contexts in one batch.
+        
+        :param question: A string question in natural language.
+        :param contexts: List of context strings, e.g. the top retrieved chunks.
+        :return: Dict with 'answer', 'score' and 'context_index', or None if no span was found.
+        """
+        if not question or not isinstance(question, str):
+            raise ValueError("Invalid question. Must be a non-empty string.")
+
+        contexts = [context for context in contexts if context and context.strip()]
+        if not contexts:
+            return None
+
+        results = self.qa_pipeline(
+            question=[question] * len(contexts),
+            context=contexts,
+            handle_impossible_answer=True
+        )
+        if isinstance(results, dict):
+            results = [results]
+
+        best = None
+        for index, result in enumerate(results):
+            if result.get('answer', '').strip() and (best is None or result['score'] > best['score']):
+                best = {'answer': result['answer'].strip(), 'score': float(result['score']), 'context_index': index}
+        return best
@@ -1,7 +1,65 @@
+import os
+import time
 import ollama
+from tracing import observe
+
+# "ollama" talks to the local Ollama daemon; "fake" is a deterministic stand-in
+# for regression and load runs that need no daemon.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")
+FAKE_LLM_DELAY = float(os.getenv("FAKE_LLM_DELAY", "0.05"))
+FAKE_LLM_MAX_WORDS = 60
+
+def _fake_chat(messages, stream=False):
+    """Mimic `ollama.chat` by echoing the start of the supplied information after a fixed delay."""
+    content = messages[-1]['content']
+    start = content.find(": ") + 2
+    words = content[start:].split()[:FAKE_LLM_MAX_WORDS]
+    time.sleep(FAKE_LLM_DELAY)
+    timings = {
+        'done': True,
+        'prompt_eval_duration': int(FAKE_LLM_DELAY * 1e9),
+        'eval_duration': 0
+    }
+    if not stream:
+        return {'message': {'content': " ".join(words)}, **timings}
+    return iter(
+        [{'message': {'content': word + " "}, 'done': False} for word in words]
+        + [{'message': {'content': ""}, **timings}]
+    )
+
+def _chat(prompt, stream=False):
+    messages = [{"role": "user", "content": prompt}]
+    if LLM_BACKEND == "fake":
+        return _fake_chat(messages, stream=stream)
+    return ollama.chat(model="llama3.2", messages=messages, stream=stream)
+
+def _record_llm_timings(response):
+    """Record Ollama's own prefill (prompt eval) and decode timings, reported in nanoseconds."""
+    if response.get('prompt_eval_duration'):
+        observe("llm_prefill", response['prompt_eval_duration'] / 1e9)
+    if response.get('eval_duration'):
+        observe("llm_decode", response['eval_duration'] / 1e9)
 
 def generate_response(query, context):
     """Generate a response using Ollama and LLaMA 3.2."""
     prompt = f"Use the following information to answer: {context}. Question: {query}"
-    response = ollama.chat(model="llama3.2", messages=[{"role": "user", "content": prompt}])
+    start = time.perf_counter()
+    response = _chat(prompt)
+    observe("llm_total", time.perf_counter() - start)
+    _record_llm_timings(response)
     return response['message']['content']
+
+def stream_response(query, context):
+    """Stream a response from Ollama and LLaMA 3.2, yielding text pieces as they are decoded."""
+    prompt = f"Use the following information to answer: {context}. Question: {query}"
+    start = time.perf_counter()
+    first_token = True
+    stream = _chat(prompt, stream=True)
+    for part in stream:
+        if first_token:
+            observe("llm_first_token", time.perf_counter() - start)
+            first_token = False
+        if part.get('done'):
+            _record_llm_timings(part)
+        yield part['message']['content']
+    observe("llm_total", time.perf_counter() - start)
@@ -0,0 +1,299 @@
+"""
+Where the retrieval stack runs.
+
+The vector collection, fact index, embedding model and extractive QA model are
+heavy and stateful, so a deployment should hold exactly one copy of them:
+
+- LocalRetrieval runs them in this process (the default, single-process mode).
+  It also owns ingestion and maintenance: the upload job queue, snapshot loading
+  at startup, the optional documents watcher and background index compaction.
+- RemoteRetrieval forwards every call to a retrieval service over HTTP
+  (see retrieval_service.py), so any number of API worker processes can serve
+  chat without loading a model or opening the index themselves.
+
+Setting RETRIEVAL_SERVICE_URL selects RemoteRetrieval, except in apps that ingest
+into their own index (the Gradio app), which pin LocalRetrieval with `use_local_retrieval()`.
+"""
+
+import os
+import json
+import logging
+import time
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import BinaryIO, Callable, Dict, List, Optional
+from admission import Overloaded
+from jobs import QueueFullError
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Base URL of the shared retrieval service; unset runs retrieval in-process
+RETRIEVAL_SERVICE_URL = os.getenv("RETRIEVAL_SERVICE_URL")
+RETRIEVAL_SERVICE_TIMEOUT = float(os.getenv("RETRIEVAL_SERVICE_TIMEOUT", "30"))
+
+DOCUMENTS_FOLDER = "documents"
+
+# Snapshot directory to load at startup, so a new replica serves without re-ingesting
+INDEX_SNAPSHOT = os.getenv("INDEX_SNAPSHOT")
+
+# Keep the index in sync with the documents folder in the background
+WATCH_DOCUMENTS = os.getenv("WATCH_DOCUMENTS", "0") == "1"
+
+# Seconds between background checks of whether the index needs compacting
+COMPACTION_INTERVAL = float(os.getenv("COMPACTION_INTERVAL", "300"))
+
+
+class RetrievalServiceError(Exception):
+    """Raised when the retrieval service cannot be reached or rejects a request."""
+
+
+class LocalRetrieval:
+    """Retrieval, fact lookup, compression, extractive QA and ingestion in this process."""
+
+    def __init__(self):
+        self.ingestion_jobs = None
+        self._qa_model = None
+        self._qa_model_failed = False
+        self._qa_model_lock = threading.Lock()
+
+    def start(self, throttle: Optional[Callable[[], None]] = None):
+        """Reset the index, load the startup snapshot and start ingestion workers.
+
+        `throttle` is passed to the ingestion queue to pause workers before embedding batches.
+        """
+        from database import clear_database, store_pdf_content
+        from jobs import IngestionJobQueue
+
+        clear_database()
+        logger.info("Database cleared and initialized successfully")
+        if INDEX_SNAPSHOT:
+            from index_snapshot import import_snapshot
+            import_snapshot(INDEX_SNAPSHOT)
+        self.ingestion_jobs = IngestionJobQueue(store_pdf_content, throttle=throttle)
+        self.ingestion_jobs.start()
+        if WATCH_DOCUMENTS:
+            from document_watcher import watch
+            os.makedirs(DOCUMENTS_FOLDER, exist_ok=True)
+            threading.Thread(target=watch, args=(DOCUMENTS_FOLDER,), daemon=True, name="document-watcher").start()
+        threading.Thread(target=self._compact_periodically, daemon=True, name="index-compactor").start()
+
+    def _compact_periodically(self):
+        while True:
+            time.sleep(COMPACTION_INTERVAL)
+            self._compact()
+
+    def _compact(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"Error compacting index: {str(e)}")
+
+    def shutdown(self):
+        """Stop the ingestion workers; unfinished jobs resume on next startup."""
+        if self.ingestion_jobs is not None:
+            self.ingestion_jobs.shutdown()
+
+    def submit_upload(self, fileobj: BinaryIO, filename: str) -> str:
+        return self.ingestion_jobs.submit(fileobj, filename)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        return self.ingestion_jobs.get(job_id)
+
+    def list_documents(self) -> Dict[str, int]:
+        from database import list_sources
+        return list_sources()
+
+    def delete_sources(self, sources: List[str]) -> Dict[str, int]:
+        """Remove the chunks and facts of `sources`; compacts in the background if enough was deleted."""
+        from database import delete_sources, deleted_ratio, COMPACTION_THRESHOLD
+        deleted = delete_sources(sources)
+        if deleted_ratio() >= COMPACTION_THRESHOLD:
+            threading.Thread(target=self._compact, daemon=True, name="index-compactor-once").start()
+        return deleted
+
+    def compact(self, force: bool = False) -> bool:
+        from database import compact_index
+        return compact_index(force=force)
+
+    def export_snapshot(self, name: str) -> Dict:
+        """Write the live index to the named snapshot; returns its manifest."""
+        from index_snapshot import export_snapshot, snapshot_path
+        return export_snapshot(snapshot_path(name))
+
+    def import_snapshot(self, name: str, merge: bool = False, verify: bool = True) -> Dict:
+        """Load the named snapshot into the live index; returns its manifest."""
+        from index_snapshot import import_snapshot, snapshot_path
+        path = snapshot_path(name)
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            raise FileNotFoundError(f"Unknown snapshot: {name}")
+        return import_snapshot(path, replace=not merge, verify=verify)
+
+    def retrieve(self, query: str, sources: Optional[List[str]] = None) -> List[str]:
+        from database import retrieve_relevant_docs
+        return retrieve_relevant_docs(query, sources=sources)
+
+    def retrieve_batch(self, queries: List[str], sources_list: Optional[List[Optional[List[str]]]] = None,
+                       n_results: int = 5) -> List[List[str]]:
+        from database import retrieve_relevant_docs_batch
+        return retrieve_relevant_docs_batch(queries, n_results, sources_list)
+
+    def answer_fact(self, query: str, sources: Optional[List[str]] = None) -> Optional[str]:
+        from database import fact_index
+        return fact_index.answer(query, sources=sources)
+
+    def compress(self, query: str, documents: List[str]) -> str:
+        from context_compression import compress_context
+        return compress_context(query, documents)
+
+    def _get_qa_model(self):
+        """Load the extractive QA model on first use; returns None if it cannot be loaded."""
+        if self._qa_model is None and not self._qa_model_failed:
+            with self._qa_model_lock:
+                if self._qa_model is None and not self._qa_model_failed:
+                    try:
+                        from medical_qa_model import MedicalQAModel
+                        self._qa_model = MedicalQAModel()
+                    except Exception as e:
+                        logger.error(f"Extractive QA tier disabled: {str(e)}")
+                        self._qa_model_failed = True
+        return self._qa_model
+
+    def extract_answer(self, query: str, documents: List[str]) -> Optional[Dict]:
+        """Best extractive span over `documents` as {answer, score, context_index}, or None."""
+        qa_model = self._get_qa_model()
+        if qa_model is None:
+            return None
+        return qa_model.answer_from_contexts(query, documents)
+
+
+class RemoteRetrieval:
+    """Client for a shared retrieval service; holds no models or index state."""
+
+    def __init__(self, base_url: str, timeout: float = RETRIEVAL_SERVICE_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path: str, payload=None, data: BinaryIO = None, headers: Dict = None,
+                 method: str = None):
+        if payload is not None:
+            data = json.dumps(payload).encode("utf-8")
+            headers = {"Content-Type": "application/json"}
+        request = urllib.request.Request(f"{self.base_url}{path}", data=data, headers=headers or {},
+                                         method=method or ("GET" if data is None else "POST"))
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            detail = e.read().decode("utf-8", errors="replace")
+            if e.code == 400:
+                raise ValueError(detail)
+            if e.code == 429:
+                raise Overloaded("retrieval", int(e.headers.get("Retry-After") or 1))
+            if e.code == 503:
+                raise QueueFullError(detail)
+            raise RetrievalServiceError(f"Retrieval service returned {e.code} for {path}: {detail}")
+        except urllib.error.URLError as e:
+            raise RetrievalServiceError(f"Retrieval service unreachable at {self.base_url}: {e.reason}")
+
+    def start(self, throttle: Optional[Callable[[], None]] = None):
+        # Ingestion, and its throttling against interactive load, run in the retrieval service
+        try:
+            self._request("/health")
+            logger.info(f"Using retrieval service at {self.base_url}")
+        except RetrievalServiceError as e:
+            # Workers may come up before the service; requests fail until it is reachable
+            logger.warning(str(e))
+
+    def shutdown(self):
+        pass
+
+    def submit_upload(self, fileobj: BinaryIO, filename: str) -> str:
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        result = self._request(
+            f"/ingest?filename={urllib.parse.quote(filename)}",
+            data=fileobj,
+            headers={"Content-Type": "application/pdf", "Content-Length": str(size)}
+        )
+        return result["job_id"]
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        return self._request(f"/jobs/{urllib.parse.quote(job_id)}")
+
+    def list_documents(self) -> Dict[str, int]:
+        return self._request("/documents")
+
+    def delete_sources(self, sources: List[str]) -> Dict[str, int]:
+        return self._request("/documents/delete", {"sources": sources})
+
+    def compact(self, force: bool = False) -> bool:
+        return self._request(f"/index/compact?force={str(force).lower()}", method="POST")["compacted"]
+
+    def export_snapshot(self, name: str) -> Dict:
+        return self._request(f"/snapshots/{urllib.parse.quote(name, safe='')}/export", method="POST")
+
+    def import_snapshot(self, name: str, merge: bool = False, verify: bool = True) -> Dict:
+        manifest = self._request(
+            f"/snapshots/{urllib.parse.quote(name, safe='')}/import"
+            f"?merge={str(merge).lower()}&verify={str(verify).lower()}",
+            method="POST"
+        )
+        if manifest is None:
+            raise FileNotFoundError(f"Unknown snapshot: {name}")
+        return manifest
+
+    def retrieve(self, query: str, sources: Optional[List[str]] = None) -> List[str]:
+        return self._request("/retrieve", {"query": query, "sources": sources})["documents"]
+
+    def retrieve_batch(self, queries: List[str], sources_list: Optional[List[Optional[List[str]]]] = None,
+                       n_results: int = 5) -> List[List[str]]:
+        result = self._request("/retrieve/batch", {
+            "queries": queries, "sources_list": sources_list, "n_results": n_results
+        })
+        return result["documents"]
+
+    def answer_fact(self, query: str, sources: Optional[List[str]] = None) -> Optional[str]:
+        return self._request("/facts/answer", {"query": query, "sources": sources})["answer"]
+
+    def compress(self, query: str, documents: List[str]) -> str:
+        return self._request("/compress", {"query": query, "documents": documents})["context"]
+
+    def extract_answer(self, query: str, documents: List[str]) -> Optional[Dict]:
+        return self._request("/extract", {"query": query, "documents": documents})["best"]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_retrieval_backend():
+    """Return the process-wide retrieval backend, chosen by RETRIEVAL_SERVICE_URL."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = RemoteRetrieval(RETRIEVAL_SERVICE_URL) if RETRIEVAL_SERVICE_URL else LocalRetrieval()
+    return _backend
+
+
+def use_local_retrieval() -> LocalRetrieval:
+    """Pin the process-wide backend to LocalRetrieval, whatever RETRIEVAL_SERVICE_URL says.
+
+    For processes that ingest into their own in-memory index, so their questions are
+    answered from that same index rather than from the shared service.
+    """
+    global _backend
+    with _backend_lock:
+        if not isinstance(_backend, LocalRetrieval):
+            if RETRIEVAL_SERVICE_URL:
+                logger.warning(f"Ignoring RETRIEVAL_SERVICE_URL={RETRIEVAL_SERVICE_URL}; this app retrieves in-process")
+            _backend = LocalRetrieval()
+    return _backend
@@ -0,0 +1,253 @@
+"""
+Shared retrieval and ingestion service.
+
+Run one instance per host; it holds the only copy of the vector collection, fact
+index, embedding model and extractive QA model. The public API (main.py) then
+runs as several stateless worker processes pointed at it:
+
+    uvicorn retrieval_service:app --port 8100
+    RETRIEVAL_SERVICE_URL=http://127.0.0.1:8100 uvicorn main:app --port 8000 --workers 4
+
+Concurrent /retrieve calls from all workers are micro-batched: requests arriving
+within RETRIEVE_BATCH_WAIT of each other are embedded in one encode call and
+searched with one vector query per source scope.
+
+Admission control runs here, next to the embedder, rather than per API worker:
+retrieval calls from all workers share one interactive budget, ingestion,
+compaction and snapshots share the bulk one, and ingestion workers pause before
+each embedding batch while interactive calls are running or queued. Overloaded
+calls get 429 with Retry-After, which the workers pass on to their clients.
+"""
+
+import io
+import os
+import asyncio
+import logging
+from typing import Dict, List, Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from admission import AdmissionController, Overloaded, ADMISSION_LIMITS, INTERACTIVE, BULK
+from jobs import QueueFullError
+from retrieval_backend import LocalRetrieval
+from tracing import increment, render_prometheus
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Most queries embedded together, and how long the first one waits for company
+RETRIEVE_MAX_BATCH = int(os.getenv("RETRIEVE_MAX_BATCH", "32"))
+RETRIEVE_BATCH_WAIT = float(os.getenv("RETRIEVE_BATCH_WAIT", "0.005"))
+
+# Interactive calls in flight across all API workers; large enough to fill retrieval batches
+RETRIEVE_ADMISSION_CONCURRENCY = int(os.getenv("RETRIEVE_ADMISSION_CONCURRENCY", str(2 * RETRIEVE_MAX_BATCH)))
+RETRIEVAL_ADMISSION_LIMITS = {
+    INTERACTIVE: {"priority": 0, "concurrency": RETRIEVE_ADMISSION_CONCURRENCY,
+                  "max_queue": int(os.getenv("RETRIEVE_ADMISSION_QUEUE", "256"))},
+    BULK: dict(ADMISSION_LIMITS[BULK], priority=1),
+}
+
+
+class RetrieveRequest(BaseModel):
+    query: str
+    sources: Optional[List[str]] = None
+
+class RetrieveBatchRequest(BaseModel):
+    queries: List[str]
+    sources_list: Optional[List[Optional[List[str]]]] = None
+    n_results: int = 5
+
+class DeleteRequest(BaseModel):
+    sources: List[str]
+
+class DocumentsRequest(BaseModel):
+    query: str
+    documents: List[str]
+
+
+class RetrievalBatcher:
+    """Collects concurrent single-query retrievals into batched index lookups."""
+
+    def __init__(self, backend: LocalRetrieval, max_batch: int = RETRIEVE_MAX_BATCH,
+                 max_wait: float = RETRIEVE_BATCH_WAIT):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def retrieve(self, query: str, sources: Optional[List[str]] = None) -> List[str]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, sources, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            increment("retrieve_batches")
+            increment("retrieve_batched_queries", len(batch))
+            try:
+                results = await run_in_threadpool(
+                    self.backend.retrieve_batch,
+                    [query for query, _, _ in batch],
+                    [sources for _, sources, _ in batch]
+                )
+            except Exception as e:
+                logger.error(f"Error in batched retrieval: {str(e)}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), documents in zip(batch, results):
+                if not future.done():
+                    future.set_result(documents)
+
+
+app = FastAPI(
+    title="Medical Assistant Retrieval Service",
+    description="Shared vector index, fact index and ingestion for Medical Assistant API workers",
+    version="1.0.0"
+)
+
+backend = LocalRetrieval()
+batcher = RetrievalBatcher(backend)
+admission = AdmissionController(RETRIEVAL_ADMISSION_LIMITS, total_concurrency=RETRIEVE_ADMISSION_CONCURRENCY)
+
+
+async def admitted(traffic_class: str, fn, *args):
+    """Await `fn(*args)` holding a slot of `traffic_class`; sheds with 429 when its queue is full."""
+    try:
+        async with admission.admit(traffic_class):
+            return await fn(*args)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Initialize the index and ingestion workers on startup."""
+    try:
+        # Ingestion workers step aside before each embedding batch while retrieval is busy
+        await run_in_threadpool(backend.start, lambda: admission.wait_for_idle(INTERACTIVE))
+        batcher.start()
+    except Exception as e:
+        logger.error(f"Error initializing retrieval service: {str(e)}")
+        raise
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await batcher.stop()
+    backend.shutdown()
+
+@app.post("/retrieve")
+async def retrieve(request: RetrieveRequest) -> Dict:
+    """Retrieve chunks for one query; batched with concurrent calls."""
+    return {"documents": await admitted(INTERACTIVE, batcher.retrieve, request.query, request.sources)}
+
+@app.post("/retrieve/batch")
+async def retrieve_batch(request: RetrieveBatchRequest) -> Dict:
+    """Retrieve chunks for a caller-assembled batch of queries."""
+    if request.sources_list is not None and len(request.sources_list) != len(request.queries):
+        raise HTTPException(status_code=400, detail="sources_list must match queries in length")
+    documents = await admitted(
+        INTERACTIVE, run_in_threadpool, backend.retrieve_batch, request.queries, request.sources_list,
+        request.n_results
+    )
+    return {"documents": documents}
+
+@app.post("/facts/answer")
+async def answer_fact(request: RetrieveRequest) -> Dict:
+    return {"answer": await admitted(INTERACTIVE, run_in_threadpool, backend.answer_fact, request.query,
+                                     request.sources)}
+
+@app.post("/compress")
+async def compress(request: DocumentsRequest) -> Dict:
+    return {"context": await admitted(INTERACTIVE, run_in_threadpool, backend.compress, request.query,
+                                      request.documents)}
+
+@app.post("/extract")
+async def extract(request: DocumentsRequest) -> Dict:
+    return {"best": await admitted(INTERACTIVE, run_in_threadpool, backend.extract_answer, request.query,
+                                   request.documents)}
+
+@app.get("/documents")
+async def list_documents() -> Dict[str, int]:
+    return await run_in_threadpool(backend.list_documents)
+
+@app.post("/documents/delete")
+async def delete_documents(request: DeleteRequest) -> Dict[str, int]:
+    return await run_in_threadpool(backend.delete_sources, request.sources)
+
+@app.post("/index/compact")
+async def compact(force: bool = False) -> Dict:
+    return {"compacted": await admitted(BULK, run_in_threadpool, backend.compact, force)}
+
+@app.post("/snapshots/{name}/export")
+async def export_snapshot(name: str) -> Dict:
+    """Write the live index to a named snapshot under the snapshots folder."""
+    try:
+        return await admitted(BULK, run_in_threadpool, backend.export_snapshot, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/snapshots/{name}/import")
+async def import_snapshot(name: str, merge: bool = False, verify: bool = True) -> Dict:
+    """Load a named snapshot into the live index, replacing it unless `merge` is set."""
+    try:
+        return await admitted(BULK, run_in_threadpool, backend.import_snapshot, name, merge, verify)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/ingest", status_code=202)
+async def ingest(request: Request, filename: str) -> Dict:
+    """Queue a raw PDF request body for ingestion."""
+    body = await request.body()
+    try:
+        job_id = await admitted(BULK, run_in_threadpool, backend.submit_upload, io.BytesIO(body), filename)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job_id}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = backend.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy", "api_version": "1.0.0"}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("RETRIEVAL_SERVICE_PORT", "8100")))
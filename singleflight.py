@@ -0,0 +1,42 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+Concurrent callers asking for the same key share one execution: the first caller
+starts the work and everyone, including later arrivals, awaits the same result.
+"""
+
+import asyncio
+import re
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, Optional
+from tracing import increment
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query for coalescing: case, whitespace and trailing punctuation folded."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!. ").lower()
+
+
+def chat_key(query: str, sources: Optional[Iterable[str]] = None) -> Hashable:
+    """Coalescing key for a chat request: the normalized query plus its document scope."""
+    return normalize_query(query), tuple(sorted(sources)) if sources is not None else None
+
+
+class SingleFlight:
+    """Share one in-flight asyncio task between concurrent callers with the same key."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Run `fn()` for `key`, or join the run already in flight for it."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            increment(f"{self.name}_executed")
+        else:
+            increment(f"{self.name}_coalesced")
+        # Shielded so one waiter disconnecting does not cancel the shared work
+        return await asyncio.shield(task)
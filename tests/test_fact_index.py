@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from fact_index import FactIndex, NEEDS_REASONING
+
+
+REPORT_PATH = os.path.join(os.path.dirname(__file__), "..", "documents", "mock_medical_report.md")
+SOURCE = "mock_medical_report.md"
+
+
+@pytest.fixture
+def index():
+    fact_index = FactIndex(":memory:")
+    with open(REPORT_PATH, encoding="utf-8") as f:
+        fact_index.index_document(f.read(), SOURCE)
+    return fact_index
+
+
+@pytest.mark.parametrize("question", [
+    "Which drug interacts with amlodipine?",
+    "Am I taking aspirin?",
+    "What was the date of the test?",
+    "Which drug goes with amlodipine?",
+    "What medications am I taking besides aspirin?",
+    "What dose of amlodipine should I take?",
+    "Am I allergic to penicillin?",
+    "What is my blood pressure medication?",
+    "Is my blood pressure normal?",
+    "Do I have diabetes?",
+    "What is my cortisol?",
+])
+def test_unrecognized_or_reasoning_questions_fall_back(index, question):
+    assert index.answer(question) is None
+
+
+@pytest.mark.parametrize("question", [
+    "Which drug interacts with amlodipine?",
+    "What dose of iron should I take?",
+    "Am I allergic to anything?",
+])
+def test_needs_reasoning_keywords(question):
+    assert NEEDS_REASONING.search(question)
+
+
+def test_medication_question(index):
+    answer = index.answer("What medications am I taking?")
+    assert "**Medications** for John Doe" in answer
+    assert "Amlodipine 5mg" in answer
+
+
+def test_lab_question_by_patient_name(index):
+    answer = index.answer("What is John Doe's hemoglobin level?")
+    assert "Hemoglobin: **10.2 g/dL**" in answer
+
+
+def test_lab_question(index):
+    assert "Blood pressure: **140/90 mmHg**" in index.answer("What's my blood pressure?")
+
+
+def test_recommended_tests_question(index):
+    assert "Electrocardiogram (ECG)" in index.answer("What tests are recommended?")
+
+
+def test_out_of_scope_sources(index):
+    assert index.answer("What medications am I taking?", sources=[]) is None
+    assert index.answer("What medications am I taking?", sources=["other.pdf"]) is None
+
+
+def test_several_patients_are_ambiguous(index):
+    index.index_document("Patient Name: Jane Roe\nPrescribed Medications:\n- Metformin 500mg\n", "jane.pdf")
+    assert index.answer("What medications am I taking?") is None
+    assert "Metformin 500mg" in index.answer("What medications is Jane Roe taking?")
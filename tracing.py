@@ -0,0 +1,114 @@
+"""
+Lightweight per-stage latency tracing.
+
+Stages are timed with `span()` (or recorded directly with `observe()`) and aggregated
+into fixed-bucket histograms, which `render_prometheus()` exposes in the Prometheus
+text format. Recording is a perf_counter call, a bisect and a short locked update,
+so it is cheap enough to leave on in production. Simple event counts are kept
+alongside with `increment()`, and point-in-time values (e.g. queue depths) with
+`set_gauge()`.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List
+
+METRIC_NAME = "medical_bot_stage_duration_seconds"
+COUNTER_NAME = "medical_bot_events_total"
+GAUGE_NAME = "medical_bot_gauge"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, n_buckets: int):
+        self.counts = [0] * (n_buckets + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+_lock = threading.Lock()
+_histograms: Dict[str, _Histogram] = {}
+_counters: Dict[str, int] = {}
+_gauges: Dict[str, float] = {}
+
+
+def observe(stage: str, seconds: float):
+    """Record one duration for a stage."""
+    index = bisect_left(DEFAULT_BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = _Histogram(len(DEFAULT_BUCKETS))
+        histogram.counts[index] += 1
+        histogram.sum += seconds
+        histogram.count += 1
+
+
+def increment(event: str, amount: int = 1):
+    """Count an event (e.g. a cache hit or a coalesced request)."""
+    with _lock:
+        _counters[event] = _counters.get(event, 0) + amount
+
+
+def set_gauge(name: str, value: float):
+    """Set a point-in-time value (e.g. a queue depth)."""
+    with _lock:
+        _gauges[name] = value
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block and record it under `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def reset():
+    """Drop all recorded histograms."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+def render_prometheus() -> str:
+    """Render all stage histograms, event counters and gauges in the Prometheus text exposition format."""
+    with _lock:
+        snapshot = {
+            stage: (list(h.counts), h.sum, h.count) for stage, h in _histograms.items()
+        }
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+
+    lines: List[str] = [
+        f"# HELP {METRIC_NAME} Latency of each request-processing stage.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    for stage in sorted(snapshot):
+        counts, total, count = snapshot[stage]
+        cumulative = 0
+        for bound, bucket_count in zip(DEFAULT_BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+        lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {total}')
+        lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {count}')
+
+    lines.append(f"# HELP {COUNTER_NAME} Count of notable request-processing events.")
+    lines.append(f"# TYPE {COUNTER_NAME} counter")
+    for event in sorted(counters):
+        lines.append(f'{COUNTER_NAME}{{event="{event}"}} {counters[event]}')
+
+    lines.append(f"# HELP {GAUGE_NAME} Current value of notable request-processing state.")
+    lines.append(f"# TYPE {GAUGE_NAME} gauge")
+    for name in sorted(gauges):
+        lines.append(f'{GAUGE_NAME}{{name="{name}"}} {gauges[name]}')
+    return "\n".join(lines) + "\n"